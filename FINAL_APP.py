@@ -5,25 +5,33 @@ Pomodoro Pro - Streamlit Cloud Version con Supabase y Autenticación
 Versión Mejorada con selección persistente
 """
 import streamlit as st
+import streamlit.components.v1 as components
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 import time
 import datetime
 from datetime import timedelta, date
 import matplotlib.pyplot as plt
 import plotly.express as px
-import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import csv
 import json
-import base64
 import io
 import gzip
-import re
-from collections import defaultdict
+import logging
+from contextlib import contextmanager
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from supabase import create_client, Client
 import hashlib
 import os
+import uuid
+import copy
+import heapq
+import sqlite3
+import threading
 
 # Configuración de Supabase (usa variables de entorno para seguridad)
 SUPABASE_URL = os.environ.get("SUPABASE_URL", "https://zgvptomznuswsipfihho.supabase.co")
@@ -47,6 +55,51 @@ supabase_service = init_supabase_service()
 # Configuración inicial y constantes
 # ==============================================
 
+# Diagnóstico: POMODORO_LOG_LEVEL fija el nivel (WARNING por defecto) y en DEBUG
+# se registra 1 de cada POMODORO_DEBUG_SAMPLE entradas del historial
+logger = logging.getLogger("pomodoro")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logger.addHandler(_handler)
+    logger.propagate = False
+
+def env_log_level(name, default="WARNING"):
+    """Nivel de logging de una variable de entorno; si no es válido se usa el de defecto"""
+    value = os.environ.get(name, default).strip().upper()
+    if isinstance(logging.getLevelName(value), int):
+        return value
+    logger.warning("%s=%r no es un nivel válido, se usa %s", name, value, default)
+    return default
+
+def env_positive_int(name, default):
+    """Entero positivo de una variable de entorno; si no es válido se usa el de defecto"""
+    try:
+        return max(1, int(os.environ.get(name, default)))
+    except ValueError:
+        logger.warning("%s=%r no es un entero, se usa %d", name, os.environ.get(name), default)
+        return default
+
+logger.setLevel(env_log_level("POMODORO_LOG_LEVEL"))
+DEBUG_SAMPLE_EVERY = env_positive_int("POMODORO_DEBUG_SAMPLE", 1000)
+
+@contextmanager
+def log_timing(operation, **details):
+    """Registra en INFO la duración de una operación junto con sus detalles"""
+    start = time.perf_counter()
+    try:
+        yield details
+    finally:
+        if logger.isEnabledFor(logging.INFO):
+            extra = ", ".join(f"{key}={value}" for key, value in details.items())
+            logger.info("%s: %.1f ms (%s)", operation, (time.perf_counter() - start) * 1000, extra)
+
+def log_sampled_entries(label, entries):
+    """Registra en DEBUG una muestra de las entradas (1 de cada DEBUG_SAMPLE_EVERY)"""
+    if logger.isEnabledFor(logging.DEBUG):
+        for i in range(0, len(entries), DEBUG_SAMPLE_EVERY):
+            logger.debug("%s %d: %s", label, i, entries[i])
+
 # Configuración de la página
 st.set_page_config(
     page_title="Pomodoro Pro",
@@ -108,15 +161,16 @@ def get_default_state():
         'start_time': None,
         'paused_time': None,
         'timer_start': None,
-        'last_update': None,
+        'phase_end': None,  # Marca de tiempo absoluta del fin de la fase en curso
         'current_theme': 'Claro',
         'activities': [],
         'current_activity': "",
         'sub_activity': "",
-        'tasks': [],
+        'tasks': TaskStore(),
         'projects': [],
         'current_project': "",
         'current_task': "",  # Nueva variable para guardar la tarea seleccionada
+        'current_task_id': None,  # Id de la tarea seleccionada (current_task guarda su nombre)
         'deadlines': [],
         'study_mode': False,
         'study_goals': [],
@@ -127,19 +181,25 @@ def get_default_state():
             'total_hours': 0
         },
         'last_session_date': None,
-        'completed_tasks': [],
-        'editing_task': None,
+        'editing_task': None,  # Id de la tarea en edición
         'editing_project': None,
         'dragging_item': None,
         'drag_type': None,
         'drag_source': None,
         'session_history': [],
+        'history_skipped': 0,  # Sesiones antiguas aún sin cargar (ver HISTORY_RECENT_DAYS)
+        'schema_version': SCHEMA_VERSION,
+        'history_version': 0,  # Cambia cada vez que se modifica session_history
+        'rollups': empty_rollups(),  # Totales incrementales del historial
         'last_updated': time.time(),
         'force_rerun': False,
         # Nuevos campos para los filtros
         'filter_activity': "Todas",
         'filter_project': "Todos",
-        'task_status_filter': "Todas"
+        'task_status_filter': "Todas",
+        'task_sort': "Creación",
+        'task_page_size': 10,
+        'backup_watermark': None  # Marca del último backup descargado (para los incrementales)
     }
 
 def format_time(seconds):
@@ -180,10 +240,22 @@ def determine_next_phase(was_work):
         return "Descanso Largo"
     return "Descanso Corto"
 
+def bump_history_version(state):
+    """Marca el historial como modificado para invalidar las estadísticas cacheadas.
+
+    La versión es monótona y se basa en el reloj, de modo que dos sesiones
+    del mismo usuario no generan la misma versión para historiales distintos.
+    """
+    state['history_version'] = max(state.get('history_version', 0) + 1, time.time_ns())
+
 def json_serial(obj):
     """JSON serializer for objects not serializable by default json code"""
     if isinstance(obj, (datetime.datetime, date)):
         return obj.isoformat()
+    if is_record(obj):
+        return obj.to_dict()
+    if is_task_store(obj):
+        return obj.to_list()
     raise TypeError("Type %s not serializable" % type(obj))
 
 # ==============================================
@@ -196,6 +268,10 @@ def convert_dates_to_iso(obj):
     """
     if isinstance(obj, (date, datetime.datetime)):
         return obj.isoformat()
+    elif is_record(obj):
+        return obj.to_dict()
+    elif is_task_store(obj):
+        return obj.to_list()
     elif isinstance(obj, dict):
         return {k: convert_dates_to_iso(v) for k, v in obj.items()}
     elif isinstance(obj, list):
@@ -203,29 +279,443 @@ def convert_dates_to_iso(obj):
     else:
         return obj
 
-def convert_iso_to_dates(obj):
+def decode_iso_value(value, as_datetime=False):
+    """Convierte un valor ISO en date/datetime; si no es válido lo deja igual"""
+    if not isinstance(value, str):
+        return value
+    try:
+        if as_datetime or len(value) > 10:
+            return datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+        return date.fromisoformat(value)
+    except ValueError:
+        return value
+
+def iso_or_none(value):
+    """Devuelve la fecha en ISO, o None si no hay fecha"""
+    return value.isoformat() if isinstance(value, (date, datetime.datetime)) else value
+
+# ==============================================
+# Esquema versionado del estado
+# ==============================================
+
+# Versión 1: registros como diccionarios, historial con claves en español y
+# duración en minutos u horas. Versión 2: registros tipados (Task, Project,
+# SessionRecord) con duración siempre en horas. Versión 3: tareas con id
+# estable en una única lista `tasks` (pendientes y completadas).
+SCHEMA_VERSION = 3
+
+def new_task_id():
+    """Genera un id estable para una tarea"""
+    return uuid.uuid4().hex[:12]
+
+@dataclass(slots=True)
+class Project:
+    """Proyecto asociado a una actividad"""
+    name: str
+    activity: str = ""
+
+    def to_dict(self):
+        return {'name': self.name, 'activity': self.activity}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(name=data['name'], activity=data.get('activity', ""))
+
+@dataclass(slots=True)
+class Task:
+    """Tarea de un proyecto"""
+    name: str
+    project: str = "Ninguno"
+    activity: str = ""
+    priority: str = "Media"
+    deadline: date = None
+    completed: bool = False
+    created: date = None
+    completed_date: date = None
+    id: str = field(default_factory=new_task_id)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'project': self.project,
+            'activity': self.activity,
+            'priority': self.priority,
+            'deadline': iso_or_none(self.deadline),
+            'completed': self.completed,
+            'created': iso_or_none(self.created),
+            'completed_date': iso_or_none(self.completed_date)
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            name=data['name'],
+            project=data.get('project', "Ninguno"),
+            activity=data.get('activity', ""),
+            priority=data.get('priority', "Media"),
+            deadline=decode_iso_value(data.get('deadline')),
+            completed=bool(data.get('completed', False)),
+            created=decode_iso_value(data.get('created')),
+            completed_date=decode_iso_value(data.get('completed_date')),
+            id=data.get('id') or new_task_id()
+        )
+
+@dataclass(slots=True)
+class SessionRecord:
+    """Sesión registrada en el historial (duración en horas)"""
+    date: date
+    start: str = "00:00:00"
+    hours: float = 0.0
+    activity: str = ""
+    project: str = ""
+    task: str = ""
+
+    @property
+    def hour(self):
+        """Hora del día en que empezó la sesión"""
+        head = self.start.split(':', 1)[0]
+        return int(head) if head.isdigit() and int(head) < 24 else 0
+
+    def to_dict(self):
+        return {
+            'date': self.date.isoformat(),
+            'start': self.start,
+            'hours': self.hours,
+            'activity': self.activity,
+            'project': self.project,
+            'task': self.task
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Crea la sesión desde el formato actual o desde el de la versión 1"""
+        if 'date' in data:
+            return cls(
+                date=date.fromisoformat(str(data['date'])[:10]),
+                start=data.get('start', "00:00:00"),
+                hours=float(data.get('hours', 0.0)),
+                activity=data.get('activity', ""),
+                project=data.get('project', ""),
+                task=data.get('task', "")
+            )
+
+        # Versión 1: claves en español y dos formatos de duración
+        fecha = data['Fecha']
+        if isinstance(fecha, datetime.datetime):
+            fecha = fecha.date()
+        elif not isinstance(fecha, date):
+            fecha = date.fromisoformat(str(fecha)[:10])
+        start = data.get('Hora Inicio', "00:00:00")
+        if isinstance(start, datetime.time):
+            start = start.strftime("%H:%M:%S")
+        if 'Tiempo Activo (min)' in data:
+            hours = float(data['Tiempo Activo (min)']) / 60
+        else:
+            hours = float(data.get('Tiempo Activo (horas)', 0.0))
+        return cls(
+            date=fecha,
+            start=str(start),
+            hours=hours,
+            activity=(data.get('Actividad') or "").strip(),
+            project=(data.get('Proyecto') or "").strip(),
+            task=(data.get('Tarea') or "").strip()
+        )
+
+class TaskStore:
+    """Tareas indexadas por id, proyecto, actividad y estado.
+
+    Todas las modificaciones pasan por el almacén para mantener los índices al
+    día; `version` aumenta con cada cambio e invalida los filtros memorizados.
+    Se guarda como una lista de tareas.
     """
-    Recursively convert all ISO date strings in the data to date or datetime objects.
+
+    INDEXED_FIELDS = ('project', 'activity', 'completed', 'deadline')
+
+    def __init__(self, tasks=()):
+        self.tasks = {}  # id -> Task, en orden de creación
+        self.by_project = {}  # proyecto -> {id: None}
+        self.by_activity = {}  # actividad -> {id: None}
+        self.by_status = {False: {}, True: {}}  # completada -> {id: None}
+        self.pending_tree = {}  # actividad -> proyecto -> {id: None} (sólo pendientes)
+        self.deadline_heap = []  # (fecha límite, posición, id) de pendientes; lo obsoleto se descarta al leer
+        self.order = {}  # id -> posición de creación
+        self.sequence = 0  # Siguiente posición libre
+        self.filter_cache = {}  # (actividad, proyecto, completada) -> [Task]
+        self.version = 0
+        for task in tasks:
+            if task.id in self.tasks:
+                task.id = new_task_id()  # Ids repetidos en datos antiguos
+            self._insert(task)
+
+    def _insert(self, task):
+        self.tasks[task.id] = task
+        self.order[task.id] = self.sequence
+        self.sequence += 1
+        self._index(task)
+
+    def _apply(self, task, changes):
+        """Aplica cambios a una tarea reindexándola sólo si cambia un campo indexado"""
+        reindex = any(name in changes for name in self.INDEXED_FIELDS)
+        if reindex:
+            self._unindex(task)
+        for name, value in changes.items():
+            setattr(task, name, value)
+        if reindex:
+            self._index(task)
+
+    def _changed(self):
+        self.version += 1
+        self.filter_cache.clear()
+
+    def _index(self, task):
+        self.by_project.setdefault(task.project, {})[task.id] = None
+        self.by_activity.setdefault(task.activity, {})[task.id] = None
+        self.by_status[task.completed][task.id] = None
+        if not task.completed:
+            projects = self.pending_tree.setdefault(task.activity, {})
+            projects.setdefault(task.project, {})[task.id] = None
+            deadline = self.due_date(task)
+            if deadline is not None:
+                heapq.heappush(self.deadline_heap, (deadline, self.order[task.id], task.id))
+
+    @staticmethod
+    def due_date(task):
+        """Fecha límite de la tarea como date, o None si no tiene"""
+        if isinstance(task.deadline, datetime.datetime):
+            return task.deadline.date()
+        return task.deadline if isinstance(task.deadline, date) else None
+
+    def _live(self, entry):
+        """Indica si una entrada del montículo sigue describiendo una tarea pendiente"""
+        task = self.tasks.get(entry[2])
+        return task is not None and not task.completed and self.due_date(task) == entry[0]
+
+    def _unindex(self, task):
+        self.by_project[task.project].pop(task.id, None)
+        self.by_activity[task.activity].pop(task.id, None)
+        self.by_status[task.completed].pop(task.id, None)
+        if not task.completed:
+            self.pending_tree[task.activity][task.project].pop(task.id, None)
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def __iter__(self):
+        return iter(list(self.tasks.values()))
+
+    def __contains__(self, task_id):
+        return task_id in self.tasks
+
+    def get(self, task_id):
+        """Devuelve la tarea con ese id, o None"""
+        return self.tasks.get(task_id)
+
+    def lookup(self, index, key):
+        """Devuelve las tareas de un índice ('project', 'activity' o 'status') para una clave"""
+        ids = getattr(self, 'by_' + index).get(key, {})
+        return [self.tasks[task_id] for task_id in ids]
+
+    def filter(self, activity=None, project=None, completed=None):
+        """Devuelve las tareas que cumplen los filtros (None = sin filtro), en orden de creación.
+
+        Se intersectan los índices empezando por el más pequeño y el resultado
+        se memoriza hasta el siguiente cambio del almacén.
+        """
+        key = (activity, project, completed)
+        if key not in self.filter_cache:
+            candidates = []
+            if activity is not None:
+                candidates.append(self.by_activity.get(activity, {}))
+            if project is not None:
+                candidates.append(self.by_project.get(project, {}))
+            if completed is not None:
+                candidates.append(self.by_status[completed])
+            if not candidates:
+                result = list(self.tasks.values())
+            else:
+                candidates.sort(key=len)
+                ids = candidates[0].keys()
+                for index in candidates[1:]:
+                    ids = {task_id for task_id in ids if task_id in index}
+                if len(ids) * 8 > len(self.tasks):
+                    # Resultado grande: recorrer en orden es más barato que ordenar
+                    result = [task for task_id, task in self.tasks.items() if task_id in ids]
+                else:
+                    result = [self.tasks[task_id] for task_id in sorted(ids, key=self.order.__getitem__)]
+            self.filter_cache[key] = result
+        return self.filter_cache[key]
+
+    def due_between(self, start, end):
+        """Devuelve las tareas pendientes con fecha límite entre start y end (inclusive).
+
+        `start` debe ser la fecha de hoy: lo ya vencido se saca del montículo de
+        forma definitiva, y sólo se recorren los nodos con fecha <= end.
+        """
+        heap = self.deadline_heap
+        while heap and (heap[0][0] < start or not self._live(heap[0])):
+            heapq.heappop(heap)
+        if len(heap) > 2 * len(self.by_status[False]) + 32:
+            # Demasiadas entradas obsoletas: reconstruir con las pendientes
+            heap[:] = [entry for entry in heap if self._live(entry)]
+            heapq.heapify(heap)
+
+        found = {}
+        stack = [0]
+        while stack:
+            i = stack.pop()
+            if i >= len(heap) or heap[i][0] > end:
+                continue
+            if self._live(heap[i]):
+                found.setdefault(heap[i][2], heap[i])
+            stack.extend((2 * i + 1, 2 * i + 2))
+        return [self.tasks[entry[2]] for entry in sorted(found.values())]
+
+    def pending_in(self, activity, project):
+        """Devuelve las tareas pendientes de un proyecto dentro de una actividad"""
+        ids = self.pending_tree.get(activity, {}).get(project, {})
+        return [self.tasks[task_id] for task_id in ids]
+
+    def pending(self):
+        return self.lookup('status', False)
+
+    def completed(self):
+        return self.lookup('status', True)
+
+    def add(self, task):
+        """Añade una tarea nueva"""
+        self._insert(task)
+        self._changed()
+        return task
+
+    def update(self, task_id, **changes):
+        """Modifica campos de una tarea y reindexa sólo esa tarea"""
+        task = self.tasks[task_id]
+        self._apply(task, changes)
+        self._changed()
+        return task
+
+    def update_many(self, task_ids, **changes):
+        """Aplica los mismos cambios a varias tareas como una sola modificación"""
+        tasks = [self.tasks[task_id] for task_id in task_ids if task_id in self.tasks]
+        for task in tasks:
+            self._apply(task, changes)
+        if tasks:
+            self._changed()
+        return len(tasks)
+
+    def complete_many(self, task_ids):
+        """Completa varias tareas; devuelve cuántas estaban pendientes"""
+        pending = [task_id for task_id in task_ids
+                   if task_id in self.tasks and not self.tasks[task_id].completed]
+        return self.update_many(pending, completed=True, completed_date=date.today())
+
+    def remove_many(self, task_ids):
+        """Elimina varias tareas como una sola modificación"""
+        removed = 0
+        for task_id in task_ids:
+            task = self.tasks.pop(task_id, None)
+            if task is not None:
+                self.order.pop(task_id)
+                self._unindex(task)
+                removed += 1
+        if removed:
+            self._changed()
+        return removed
+
+    def complete(self, task_id):
+        """Marca una tarea como completada; devuelve False si ya lo estaba"""
+        if self.tasks[task_id].completed:
+            return False
+        self.update(task_id, completed=True, completed_date=date.today())
+        return True
+
+    def remove(self, task_id):
+        """Elimina una tarea"""
+        task = self.tasks.pop(task_id)
+        self.order.pop(task_id)
+        self._unindex(task)
+        self._changed()
+        return task
+
+    def rename_project(self, old_name, old_activity, new_name, new_activity):
+        """Mueve las tareas de un proyecto renombrado o cambiado de actividad"""
+        for task in self.lookup('project', old_name):
+            if task.activity == old_activity:
+                self.update(task.id, project=new_name, activity=new_activity)
+
+    def detach_project(self, name):
+        """Deja sin proyecto ("Ninguno") las tareas de un proyecto eliminado"""
+        for task in self.lookup('project', name):
+            self.update(task.id, project="Ninguno")
+
+    def to_list(self):
+        return [task.to_dict() for task in self.tasks.values()]
+
+def is_task_store(obj):
+    """Indica si obj es un TaskStore (ver is_record sobre la comparación por nombre)"""
+    return type(obj).__name__ == 'TaskStore'
+
+def is_record(obj):
+    """Indica si obj es un registro del esquema (Task, Project o SessionRecord).
+
+    Se compara por nombre de clase porque Streamlit vuelve a ejecutar el script
+    en cada interacción y los registros guardados en session_state pertenecen
+    a la definición de clase de una ejecución anterior.
     """
-    if isinstance(obj, str):
-        # Check if the string matches a date pattern
+    return type(obj).__name__ in ('Task', 'Project', 'SessionRecord')
+
+def decode_sessions(entries, rejected=None):
+    """Convierte entradas del historial en SessionRecord, descartando las inválidas.
+
+    Si se pasa la lista `rejected`, las entradas descartadas se añaden tal cual
+    para que el llamador pueda conservarlas.
+    """
+    records = []
+    for i, entry in enumerate(entries):
+        if is_record(entry):
+            records.append(entry)
+            continue
         try:
-            # For date strings (YYYY-MM-DD)
-            if re.match(r'^\d{4}-\d{2}-\d{2}$', obj):
-                return datetime.datetime.strptime(obj, '%Y-%m-%d').date()
-            # For datetime strings (YYYY-MM-DDTHH:MM:SS or with microseconds and timezone)
-            elif re.match(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}', obj):
-                # Try parsing with datetime
-                return datetime.datetime.fromisoformat(obj.replace('Z', '+00:00'))
-        except (ValueError, AttributeError):
-            pass
-        return obj
-    elif isinstance(obj, dict):
-        return {k: convert_iso_to_dates(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_iso_to_dates(element) for element in obj]
-    else:
-        return obj
+            records.append(SessionRecord.from_dict(entry))
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning("Sesión %d descartada al migrar: %s (%s)", i, entry, e)
+            if rejected is not None:
+                rejected.append(entry)
+    return records
+
+def decode_state(data):
+    """Decodifica un estado (o backup) leído de JSON y lo migra al esquema actual.
+
+    Convierte los registros en Task, Project y SessionRecord, normaliza los
+    formatos antiguos y sólo parsea los campos de fecha conocidos. Modifica y
+    devuelve `data`, que debe ser un objeto recién parseado.
+    """
+    stored_version = data.get('schema_version', 1)
+    for key in ('last_session_date',):
+        if key in data:
+            data[key] = decode_iso_value(data[key])
+    if 'start_time' in data:
+        data['start_time'] = decode_iso_value(data['start_time'], as_datetime=True)
+
+    # Hasta la versión 2 las completadas vivían aparte en `completed_tasks`
+    completed_tasks = data.pop('completed_tasks', None)
+    if isinstance(data.get('tasks'), list):
+        tasks = data['tasks']
+        if stored_version < 3 and isinstance(completed_tasks, list):
+            tasks = tasks + completed_tasks
+        data['tasks'] = TaskStore(task if is_record(task) else Task.from_dict(task) for task in tasks)
+    if isinstance(data.get('projects'), list):
+        data['projects'] = [Project.from_dict(project) for project in data['projects']]
+    if isinstance(data.get('session_history'), list):
+        data['session_history'] = decode_sessions(data['session_history'])
+    if not isinstance(data.get('editing_task'), str):
+        data['editing_task'] = None  # Ahora se guarda el id de la tarea
+    if isinstance(data.get('editing_project'), dict):
+        data['editing_project'] = Project.from_dict(data['editing_project'])
+
+    data['schema_version'] = SCHEMA_VERSION
+    return data
 
 # ==============================================
 # Funciones de autenticación y seguridad (Mejoradas)
@@ -249,7 +739,7 @@ def register_user(username, password):
         response = supabase_service.table('users').insert({
             'username': username,
             'password_hash': hashed_pw,
-            'data': convert_dates_to_iso(get_default_state())
+            'data': convert_dates_to_iso(dict(persisted_state_items(get_default_state())))
         }).execute()
         
         return True, "Usuario registrado exitosamente"
@@ -331,7 +821,193 @@ def auth_section():
 # Funciones de importación/exportación con Supabase (Mejoradas)
 # ==============================================
 
-def save_to_supabase():
+# Claves del estado que no se guardan en la columna JSON `data`
+SEPARATE_STATE_KEYS = ('session_history', 'history_skipped')
+
+def persisted_state_items(state):
+    """Recorre las claves del estado que se guardan en la columna JSON `data`"""
+    return ((key, value) for key, value in state.items() if key not in SEPARATE_STATE_KEYS)
+
+def encode_state_entry(value):
+    """Serializa un valor del estado a JSON canónico (fechas en ISO)"""
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, default=json_serial)
+
+def state_fingerprint(encoded):
+    """Huella compacta de un valor serializado para detectar cambios"""
+    return hashlib.blake2b(encoded.encode('utf-8'), digest_size=16).digest()
+
+def diff_state(state, snapshot):
+    """Compara el estado con la última versión guardada.
+
+    Devuelve un diccionario {clave: json} sólo con las claves modificadas y el
+    tamaño en bytes del estado completo serializado.
+    """
+    changed = {}
+    full_size = 0
+    for key, value in persisted_state_items(state):
+        encoded = encode_state_entry(value)
+        full_size += len(encoded.encode('utf-8'))
+        if snapshot.get(key) != state_fingerprint(encoded):
+            changed[key] = encoded
+    return changed, full_size
+
+def mark_state_saved(changed):
+    """Actualiza las huellas de las claves ya persistidas en Supabase"""
+    snapshot = st.session_state.setdefault('saved_snapshot', {})
+    for key, encoded in changed.items():
+        snapshot[key] = state_fingerprint(encoded)
+
+def record_save_stats(changed, full_size):
+    """Registra el tamaño de cada guardado para mostrarlo en la barra lateral"""
+    payload_size = sum(len(encoded.encode('utf-8')) for encoded in changed.values())
+    stats = st.session_state.setdefault('save_stats', {
+        'saves': 0, 'bytes_sent': 0, 'bytes_full': 0
+    })
+    stats['saves'] += 1
+    stats['bytes_sent'] += payload_size
+    stats['bytes_full'] += full_size
+    stats['last_bytes'] = payload_size
+    stats['last_full_bytes'] = full_size
+    stats['last_keys'] = sorted(changed)
+    return payload_size
+
+# Ventana en la que se agrupan varios guardados en una sola escritura
+SAVE_COALESCE_SECONDS = 2.0
+# Espera antes de reintentar un guardado en segundo plano que falló
+SAVE_RETRY_SECONDS = 10.0
+
+# Errores de PostgREST cuando la función RPC no existe en la base de datos
+MISSING_FUNCTION_CODES = ('PGRST202', '404')
+
+def is_missing_function_error(error):
+    """Indica si un error de Supabase significa que la función RPC no está desplegada"""
+    return str(getattr(error, 'code', '')) in MISSING_FUNCTION_CODES
+
+class SaveQueue:
+    """Cola de guardado diferido (write-behind) para un usuario.
+
+    Los cambios enviados en una ventana corta se fusionan y se escriben en
+    Supabase con una sola llamada desde un hilo en segundo plano.
+    """
+
+    def __init__(self, username, delay=SAVE_COALESCE_SECONDS):
+        self.username = username
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()  # Una sola escritura en curso: llegan en orden
+        self.pending = {}
+        self.pending_full = False
+        self.timer = None
+        self.delta_unavailable = False
+        self.requested = 0
+        self.sent = 0
+        self.last_error = None
+        self.state = None  # Estado de la sesión: permite rehacer el guardado completo
+
+    def submit(self, patch, full=False):
+        """Encola un parche {clave: valor}; las claves repetidas se sobrescriben"""
+        with self.lock:
+            self.requested += 1
+            self.pending.update(patch)
+            self.pending_full = self.pending_full or full
+            self._schedule(self.delay)
+
+    def _schedule(self, delay):
+        """Programa un flush si no hay ninguno pendiente (llamar con self.lock)"""
+        if self.timer is None:
+            self.timer = threading.Timer(delay, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        """Escribe ya lo pendiente. Devuelve False si la escritura falló.
+
+        Las escrituras se serializan con `write_lock`: un flush inmediato espera
+        a la escritura en curso y envía después los valores más recientes, así
+        que un parche antiguo nunca llega el último.
+        """
+        with self.write_lock:
+            with self.lock:
+                if self.timer is not None:
+                    self.timer.cancel()
+                    self.timer = None
+                if not self.pending:
+                    return self.last_error is None
+                # Sin RPC sólo se puede reescribir el estado completo
+                if self.delta_unavailable and not self.pending_full:
+                    try:
+                        full_patch = self._full_patch()
+                    except RuntimeError as e:  # El estado cambió mientras se serializaba
+                        self.last_error = str(e)
+                        self._schedule(SAVE_RETRY_SECONDS)
+                        return False
+                    if full_patch is None:
+                        return self.last_error is None
+                    self.pending, self.pending_full = {**self.pending, **full_patch}, True
+                patch, full = self.pending, self.pending_full
+                self.pending, self.pending_full = {}, False
+
+            try:
+                self._write(patch, full)
+                with self.lock:
+                    self.sent += 1
+                    self.last_error = None
+                return True
+            except Exception as e:
+                with self.lock:
+                    # Conservar lo no enviado sin pisar cambios más recientes y reintentar
+                    self.pending = {**patch, **self.pending}
+                    self.pending_full = self.pending_full or full
+                    self.last_error = str(e)
+                    self._schedule(SAVE_RETRY_SECONDS)
+                return False
+
+    def _full_patch(self):
+        """Serializa el estado completo para reescribir la columna `data`"""
+        if self.state is None:
+            return None
+        return {key: json.loads(encode_state_entry(value))
+                for key, value in list(persisted_state_items(self.state))}
+
+    def _write(self, patch, full):
+        """Envía un parche a Supabase por RPC o, si no existe, con un UPDATE completo"""
+        if not self.delta_unavailable:
+            try:
+                # Fusiona las claves modificadas en la columna JSON (ver supabase/merge_user_data.sql)
+                supabase_service.rpc('merge_user_data', {
+                    'p_username': self.username,
+                    'p_patch': patch
+                }).execute()
+                return
+            except Exception as e:
+                # Sólo se pasa a guardados completos si la función no existe; un
+                # timeout o un 5xx es un fallo normal y se reintenta el parche
+                if not is_missing_function_error(e):
+                    raise
+                self.delta_unavailable = True
+                if not full:
+                    raise
+        # Usar UPDATE en lugar de UPSERT para no afectar password_hash
+        supabase_service.table('users').update({
+            'data': patch,
+            'last_updated': datetime.datetime.now().isoformat()
+        }).eq('username', self.username).execute()
+
+def get_save_queue():
+    """Devuelve la cola de guardado del usuario de esta sesión"""
+    queue = st.session_state.get('save_queue')
+    if queue is None or queue.username != st.session_state.username:
+        queue = SaveQueue(st.session_state.username)
+        st.session_state.save_queue = queue
+    queue.state = st.session_state.get('pomodoro_state')
+    return queue
+
+def save_to_supabase(immediate=False):
+    """Encola en Supabase sólo las partes del estado que cambiaron.
+
+    La escritura se agrupa con otros guardados cercanos salvo que
+    `immediate` sea True, en cuyo caso se envía y se espera el resultado.
+    """
     if not check_authentication():
         st.error("Debes iniciar sesión para guardar datos")
         return False
@@ -339,18 +1015,30 @@ def save_to_supabase():
     try:
         # Usar el estado actual directamente, sin copia
         state = st.session_state.pomodoro_state
-        username = st.session_state.username
+        queue = get_save_queue()
         
-        # Convertir el estado actual a formato ISO
-        data_to_save = convert_dates_to_iso(state)
+        # Sin la función RPC en la base de datos hay que reenviar el estado completo
+        if queue.delta_unavailable:
+            st.session_state.saved_snapshot = {}
+        snapshot = st.session_state.setdefault('saved_snapshot', {})
+        changed, full_size = diff_state(state, snapshot)
+        record_save_stats(changed, full_size)
         
-        # Usar UPDATE en lugar de UPSERT para no afectar password_hash
-        response = supabase_service.table('users').update({
-            'data': data_to_save,
-            'last_updated': datetime.datetime.now().isoformat()
-        }).eq('username', username).execute()
+        if changed:
+            queue.submit(
+                {key: json.loads(encoded) for key, encoded in changed.items()},
+                full=not snapshot
+            )
+            mark_state_saved(changed=changed)
         
-        st.success("Datos guardados correctamente!")
+        if immediate:
+            if not queue.flush():
+                if queue.delta_unavailable and not queue.pending_full:
+                    # La función RPC no existe: reintentar con el estado completo
+                    return save_to_supabase(immediate=True)
+                st.error(f"Error al guardar: {queue.last_error}")
+                return False
+            st.success("Datos guardados correctamente!")
         return True
     except Exception as e:
         st.error(f"Error al guardar: {str(e)}")
@@ -365,7 +1053,11 @@ def load_from_supabase():
     try:
         username = st.session_state.username
         
+        # Escribir antes los guardados pendientes para no pisar lo que se carga
+        get_save_queue().flush()
+        
         # Usar cliente de servicio para bypass RLS
+        load_start = time.perf_counter()
         response = supabase_service.table('users') \
             .select('data') \
             .eq('username', username) \
@@ -375,31 +1067,289 @@ def load_from_supabase():
             st.warning("No se encontraron datos para este usuario")
             return False
             
-        imported_data = convert_iso_to_dates(response.data[0]['data'])
+        data = response.data[0]['data'] or {}
+        legacy_history = data.pop('session_history', None)
+        stored_version = data.get('schema_version', 1)
+        imported_data = decode_state(data)
+        
+        # El historial vive en su propia tabla. Si los totales guardados lo cubren
+        # entero basta con las sesiones recientes; si no (o hay que migrar) se lee todo
+        store = init_session_store()
+        total = store.count(username)
+        rollups = imported_data.get('rollups')
+        full = bool(legacy_history) or not rollups or 'streak' not in rollups \
+            or rollups.get('entries') != total
+        if full:
+            history = store.fetch(username)
+        else:
+            history = store.fetch(username, since=date.today() - timedelta(days=HISTORY_RECENT_DAYS))
+        migrated = True
+        rejected = []
+        if legacy_history:
+            legacy = decode_sessions(legacy_history, rejected)
+            if len(history) < len(legacy):
+                # Conservar las sesiones registradas después de una migración parcial
+                kept = 0
+                while kept < len(history) and history[kept] == legacy[kept]:
+                    kept += 1
+                store.replace(username, legacy + history[kept:])
+                history = store.fetch(username)
+            migrated = len(history) >= len(legacy)
+        if not migrated:
+            # Nunca quitar el historial incrustado si la tabla no lo cubre entero
+            logger.warning("load_from_supabase: migración del historial incompleta (usuario=%s)", username)
+            history = decode_sessions(legacy_history)
+        elif legacy_history is not None or stored_version != SCHEMA_VERSION:
+            if rejected:
+                # Las entradas que no se pudieron leer se guardan aparte, nunca se borran
+                data['rejected_sessions'] = list(data.get('rejected_sessions') or []) + rejected
+                st.warning(f"{len(rejected)} sesiones antiguas no válidas se guardaron aparte "
+                           f"(rejected_sessions) en lugar de migrarlas")
+            # Reescribir una única vez el estado migrado, sin el historial incrustado
+            supabase_service.table('users').update({
+                'data': convert_dates_to_iso(data),
+                'last_updated': datetime.datetime.now().isoformat()
+            }).eq('username', username).execute()
+        imported_data['session_history'] = history
+        imported_data['history_skipped'] = 0 if full else total - len(history)
+        bump_history_version(imported_data)
+        ensure_rollups(imported_data)
+        if 'achievements' in imported_data:
+            sync_streak(imported_data)
         
         # Actualiza el estado completo
         for key, value in imported_data.items():
             st.session_state.pomodoro_state[key] = value
         
+        # Lo cargado ya está en Supabase: los próximos guardados envían sólo cambios
+        st.session_state.saved_snapshot = {}
+        mark_state_saved(changed={
+            key: encode_state_entry(value) for key, value in persisted_state_items(imported_data)
+        })
+        logger.info("load_from_supabase: %.1f ms (usuario=%s, sesiones=%d, sin cargar=%d)",
+                    (time.perf_counter() - load_start) * 1000, username, len(history),
+                    imported_data['history_skipped'])
+        
         st.success("Datos cargados correctamente!")
         return True
     except Exception as e:
         st.warning(f"No se encontraron datos o error: {str(e)}")
         return False
 
-# Funciones de export/import originales como respaldo
-def export_data():
-    """Exporta todos los datos a un JSON comprimido (backup local)"""
-    state = st.session_state.pomodoro_state.copy()
-    
-    # Preparar datos para exportación
-    export_dict = {
-        'activities': state['activities'],
-        'tasks': state['tasks'],
-        'completed_tasks': state['completed_tasks'],
-        'projects': state['projects'],
-        'achievements': state['achievements'],
-        'session_history': state['session_history'],
+# ==============================================
+# Historial de sesiones (tabla propia, sólo inserciones)
+# ==============================================
+
+def session_to_row(username, entry):
+    """Convierte una SessionRecord en una fila de la tabla sessions"""
+    return {
+        'username': username,
+        'fecha': entry.date.isoformat(),
+        'hora_inicio': entry.start,
+        'horas': entry.hours,
+        'actividad': entry.activity,
+        'proyecto': entry.project,
+        'tarea': entry.task
+    }
+
+def row_to_session(row):
+    """Convierte una fila de la tabla sessions en una SessionRecord"""
+    return SessionRecord(
+        date=date.fromisoformat(row['fecha']),
+        start=row['hora_inicio'],
+        hours=float(row['horas']),
+        activity=row['actividad'] or "",
+        project=row['proyecto'] or "",
+        task=row['tarea'] or ""
+    )
+
+class SupabaseSessionStore:
+    """Historial de sesiones en la tabla `sessions` de Supabase (ver supabase/sessions.sql)"""
+
+    PAGE_SIZE = 1000  # Límite de filas por respuesta de PostgREST
+
+    def __init__(self, client):
+        self.client = client
+
+    def append(self, username, entry):
+        """Registra una sesión con un único INSERT"""
+        self.client.table('sessions').insert(session_to_row(username, entry)).execute()
+
+    def append_many(self, username, entries):
+        """Inserta varias sesiones en bloque"""
+        rows = [session_to_row(username, entry) for entry in entries]
+        for start in range(0, len(rows), self.PAGE_SIZE):
+            self.client.table('sessions').insert(rows[start:start + self.PAGE_SIZE]).execute()
+
+    def fetch(self, username, since=None, until=None):
+        """Devuelve las sesiones del usuario, opcionalmente entre dos fechas (inclusive)"""
+        entries = []
+        start = 0
+        while True:
+            query = self.client.table('sessions') \
+                .select('fecha, hora_inicio, horas, actividad, proyecto, tarea') \
+                .eq('username', username)
+            if since is not None:
+                query = query.gte('fecha', since.isoformat())
+            if until is not None:
+                query = query.lte('fecha', until.isoformat())
+            response = query.order('id').range(start, start + self.PAGE_SIZE - 1).execute()
+            entries.extend(row_to_session(row) for row in response.data)
+            if len(response.data) < self.PAGE_SIZE:
+                return entries
+            start += self.PAGE_SIZE
+
+    def count(self, username):
+        """Número de sesiones del usuario, sin descargarlas"""
+        response = self.client.table('sessions') \
+            .select('id', count='exact') \
+            .eq('username', username) \
+            .limit(1) \
+            .execute()
+        return response.count or 0
+
+    def replace(self, username, entries):
+        """Sustituye todo el historial del usuario en una sola transacción (RPC)"""
+        self.client.rpc('replace_user_sessions', {
+            'p_username': username,
+            'p_rows': [session_to_row(username, entry) for entry in entries]
+        }).execute()
+
+    def clear(self, username):
+        """Elimina todo el historial del usuario"""
+        self.client.table('sessions').delete().eq('username', username).execute()
+
+class SQLiteSessionStore:
+    """Sustituto local de la tabla sessions sobre SQLite (desarrollo y pruebas)"""
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " username TEXT NOT NULL, fecha TEXT NOT NULL, hora_inicio TEXT,"
+                " horas REAL NOT NULL, actividad TEXT, proyecto TEXT, tarea TEXT)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS sessions_username_fecha ON sessions (username, fecha)"
+            )
+
+    def append(self, username, entry):
+        """Registra una sesión con un único INSERT"""
+        self.append_many(username, [entry])
+
+    def append_many(self, username, entries):
+        """Inserta varias sesiones en bloque"""
+        rows = [session_to_row(username, entry) for entry in entries]
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO sessions (username, fecha, hora_inicio, horas, actividad, proyecto, tarea)"
+                " VALUES (:username, :fecha, :hora_inicio, :horas, :actividad, :proyecto, :tarea)",
+                rows
+            )
+
+    def fetch(self, username, since=None, until=None):
+        """Devuelve las sesiones del usuario, opcionalmente entre dos fechas (inclusive)"""
+        sql = "SELECT fecha, hora_inicio, horas, actividad, proyecto, tarea FROM sessions WHERE username = ?"
+        params = [username]
+        if since is not None:
+            sql += " AND fecha >= ?"
+            params.append(since.isoformat())
+        if until is not None:
+            sql += " AND fecha <= ?"
+            params.append(until.isoformat())
+        with self.lock:
+            rows = self.conn.execute(sql + " ORDER BY id", params).fetchall()
+        return [row_to_session(row) for row in rows]
+
+    def count(self, username):
+        """Número de sesiones del usuario, sin descargarlas"""
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM sessions WHERE username = ?",
+                                     (username,)).fetchone()[0]
+
+    def replace(self, username, entries):
+        """Sustituye todo el historial del usuario en una sola transacción"""
+        rows = [session_to_row(username, entry) for entry in entries]
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM sessions WHERE username = ?", (username,))
+            self.conn.executemany(
+                "INSERT INTO sessions (username, fecha, hora_inicio, horas, actividad, proyecto, tarea)"
+                " VALUES (:username, :fecha, :hora_inicio, :horas, :actividad, :proyecto, :tarea)",
+                rows
+            )
+
+    def clear(self, username):
+        """Elimina todo el historial del usuario"""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM sessions WHERE username = ?", (username,))
+
+@st.cache_resource
+def init_session_store():
+    """Devuelve el almacén del historial (SQLite si POMODORO_SESSIONS_DB está definido)"""
+    path = os.environ.get("POMODORO_SESSIONS_DB")
+    if path:
+        return SQLiteSessionStore(path)
+    return SupabaseSessionStore(supabase_service)
+
+# Días de historial que se cargan al iniciar sesión. Métricas, gráficos, alertas
+# y racha salen de los totales (rollups); el detalle completo sólo lo necesitan
+# la tabla resumen y el backup, que lo piden con load_full_history.
+HISTORY_RECENT_DAYS = 90
+
+def load_full_history(state):
+    """Completa el historial con las sesiones antiguas que no se cargaron al iniciar sesión"""
+    if state.get('history_skipped') and check_authentication():
+        state['session_history'] = init_session_store().fetch(st.session_state.username)
+        state['history_skipped'] = 0
+        bump_history_version(state)
+    return state['session_history']
+
+# ==============================================
+# Backups locales (gzip NDJSON)
+# ==============================================
+
+# Formato del backup: una línea JSON por registro. La primera es la cabecera
+# ('header') con la configuración y los datos pequeños; después una línea por
+# tarea ('task') y una por sesión ('session'). Se escribe sin indentación y
+# se comprime a medida que se genera.
+#
+# Un backup incremental ('kind': 'incremental') sólo lleva lo ocurrido desde
+# el backup anterior (su 'base'): las tareas nuevas o modificadas, una línea
+# 'task_deleted' por cada tarea borrada y las sesiones a partir de
+# 'session_offset' (el historial sólo crece, así que basta con la posición).
+# La marca del último backup se guarda en state['backup_watermark'].
+BACKUP_CHUNK_LINES = 1000
+
+def task_fingerprint(task):
+    """Huella corta de una tarea para detectar cambios entre backups"""
+    return hashlib.blake2b(encode_state_entry(task).encode('utf-8'), digest_size=8).hexdigest()
+
+def task_fingerprints(tasks):
+    """Huellas de todas las tareas, por id"""
+    return {task.id: task_fingerprint(task) for task in tasks}
+
+def make_watermark(backup_id, fingerprints, sessions):
+    """Marca de agua de un backup: qué tareas y cuántas sesiones contenía"""
+    return {
+        'id': backup_id,
+        'sessions': sessions,
+        'tasks': fingerprints,
+        'created': datetime.datetime.now().isoformat()
+    }
+
+def backup_snapshot(state):
+    """Copia superficial de lo que entra en el backup (barata: sólo referencias)"""
+    return {
+        'activities': list(state['activities']),
+        'tasks': list(state['tasks']),
+        'projects': list(state['projects']),
+        'achievements': dict(state['achievements']),
+        'session_history': list(state['session_history']),
+        'watermark': state.get('backup_watermark'),
         'settings': {
             'work_duration': state['work_duration'],
             'short_break': state['short_break'],
@@ -409,38 +1359,281 @@ def export_data():
             'current_theme': state['current_theme']
         }
     }
+
+def backup_lines(snapshot, backup_id, fingerprints, incremental=False):
+    """Genera las líneas NDJSON del backup (completo o incremental respecto a la marca)"""
+    watermark = snapshot['watermark'] if incremental else None
+    if watermark:
+        previous = watermark['tasks']
+        tasks = [task for task in snapshot['tasks'] if previous.get(task.id) != fingerprints[task.id]]
+        deleted = [task_id for task_id in previous if task_id not in fingerprints]
+        offset = watermark['sessions']
+    else:
+        tasks, deleted, offset = snapshot['tasks'], [], 0
+    sessions = snapshot['session_history'][offset:]
+
+    header = {
+        'type': 'header',
+        'schema_version': SCHEMA_VERSION,
+        'kind': 'incremental' if watermark else 'full',
+        'backup_id': backup_id,
+        'base': watermark['id'] if watermark else None,
+        'session_offset': offset,
+        'activities': snapshot['activities'],
+        'projects': snapshot['projects'],
+        'achievements': snapshot['achievements'],
+        'settings': snapshot['settings'],
+        'counts': {'tasks': len(tasks), 'sessions': len(sessions), 'deleted': len(deleted)}
+    }
+    yield json.dumps(header, ensure_ascii=False, default=json_serial) + "\n"
+    for task in tasks:
+        yield json.dumps({'type': 'task', **task.to_dict()}, ensure_ascii=False) + "\n"
+    for task_id in deleted:
+        yield json.dumps({'type': 'task_deleted', 'id': task_id}) + "\n"
+    for session in sessions:
+        yield json.dumps({'type': 'session', **session.to_dict()}, ensure_ascii=False) + "\n"
+
+def build_backup(snapshot, incremental=False, backup_id=None):
+    """Comprime el backup por bloques de líneas, sin construir el JSON completo en memoria.
+
+    Devuelve (bytes, marca de agua nueva).
+    """
+    with log_timing("build_backup", tareas=len(snapshot['tasks']),
+                    sesiones=len(snapshot['session_history']), incremental=incremental) as details:
+        backup_id = backup_id or uuid.uuid4().hex[:12]
+        fingerprints = task_fingerprints(snapshot['tasks'])
+        buffer = io.BytesIO()
+        with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=6) as gz:
+            chunk = []
+            for line in backup_lines(snapshot, backup_id, fingerprints, incremental):
+                chunk.append(line)
+                if len(chunk) >= BACKUP_CHUNK_LINES:
+                    gz.write("".join(chunk).encode('utf-8'))
+                    chunk = []
+            gz.write("".join(chunk).encode('utf-8'))
+        details.update(bytes=buffer.tell())
+        watermark = make_watermark(backup_id, fingerprints, len(snapshot['session_history']))
+        return buffer.getvalue(), watermark
+
+def export_data():
+    """Ofrece el backup local; sólo se genera cuando el usuario pulsa descargar.
+
+    La marca avanza al generar el archivo: el id de cada backup va en el nombre
+    del archivo y se muestra de qué backup depende el siguiente incremental.
+    """
+    state = st.session_state.pomodoro_state
+    snapshot = backup_snapshot(state)
+    backup_id = uuid.uuid4().hex[:12]
+    incremental = st.radio(
+        "Tipo de backup",
+        ["Completo", "Incremental"],
+        horizontal=True,
+        disabled=not snapshot['watermark'],
+        help="El incremental sólo incluye los cambios desde el último backup descargado",
+        key="backup_kind"
+    ) == "Incremental" and bool(snapshot['watermark'])
+    watermark = snapshot['watermark']
+    if watermark:
+        created = watermark.get('created', '')[:16].replace('T', ' ')
+        st.caption(f"El incremental se aplica sobre el backup `{watermark['id']}` ({created}): "
+                   f"guarda ese archivo para poder restaurarlo")
+
+    history_skipped = state.get('history_skipped', 0)
+    store = init_session_store() if history_skipped else None
+    username = st.session_state.get('username')
+
+    def generate():
+        if history_skipped:
+            # El backup lleva el historial entero: las sesiones antiguas se leen al descargarlo
+            snapshot['session_history'] = store.fetch(username)
+        data, state['backup_watermark'] = build_backup(snapshot, incremental, backup_id)
+        return data
+
+    st.download_button(
+        label="Descargar backup",
+        data=generate,
+        file_name=f"pomodoro_backup_{backup_id}_incremental.ndjson.gz" if incremental
+                  else f"pomodoro_backup_{backup_id}.ndjson.gz",
+        mime="application/gzip",
+        key="download_backup"
+    )
+
+# Cada cuántas líneas se actualiza la barra de progreso de la importación
+IMPORT_PROGRESS_EVERY = 5000
+
+def read_backup(fileobj, on_progress=None):
+    """Lee un backup comprimido línea a línea, validando cada registro al llegar.
+
+    Descomprime y parsea en streaming: nunca se tiene en memoria el texto
+    completo ni el JSON entero, sólo los registros ya validados. Devuelve
+    (datos, líneas descartadas). Los backups antiguos (un único objeto JSON)
+    no se pueden trocear y se leen de una vez.
+    """
+    fileobj.seek(0, io.SEEK_END)
+    total = fileobj.tell() or 1
+    fileobj.seek(0)
+    with gzip.GzipFile(fileobj=fileobj, mode='rb') as gz, io.TextIOWrapper(gz, encoding='utf-8') as text:
+        first_line = text.readline()
+        try:
+            header = json.loads(first_line)
+        except ValueError:
+            header = None
+        if not isinstance(header, dict) or header.get('type') != 'header':
+            return json.loads(first_line + text.read()), 0  # Formato antiguo
+
+        if header.get('schema_version', 1) > SCHEMA_VERSION:
+            raise ValueError("el backup es de una versión más nueva de la aplicación")
+
+        data = {key: value for key, value in header.items() if key not in ('type', 'counts')}
+        tasks, sessions, deleted, invalid = [], [], [], 0
+        for number, line in enumerate(text, start=2):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                kind = record.pop('type', None)
+                if kind == 'task':
+                    tasks.append(Task.from_dict(record))
+                elif kind == 'session':
+                    sessions.append(SessionRecord.from_dict(record))
+                elif kind == 'task_deleted':
+                    deleted.append(str(record['id']))
+                else:
+                    raise ValueError(f"tipo de registro desconocido: {kind!r}")
+            except (KeyError, TypeError, ValueError, AttributeError) as e:
+                invalid += 1
+                logger.warning("Línea %d del backup descartada: %s", number, e)
+            if on_progress and number % IMPORT_PROGRESS_EVERY == 0:
+                on_progress(min(fileobj.tell() / total, 1.0))
+
+    # La cabecera indica cuántos registros se escribieron: detecta archivos truncados
+    expected = header.get('counts', {})
+    missing = (expected.get('tasks', len(tasks)) - len(tasks)) + \
+              (expected.get('sessions', len(sessions)) - len(sessions)) + \
+              (expected.get('deleted', len(deleted)) - len(deleted))
+    data['tasks'] = tasks
+    data['session_history'] = sessions
+    data['deleted_tasks'] = deleted
+    return data, max(invalid, missing)
+
+# Backups ya parseados que se guardan por sesión hasta aplicarlos (clave: sha256 del
+# contenido); sirven para reintentar una importación fallida sin volver a parsear
+IMPORT_CACHE_SIZE = 4
+
+def upload_digests(uploaded_files):
+    """Devuelve el sha256 de cada archivo subido, calculado una sola vez por subida"""
+    known = st.session_state.get('upload_digests', {})
+    current, digests = {}, []
+    for uploaded_file in uploaded_files:
+        file_id = getattr(uploaded_file, 'file_id', None)
+        digest = known.get(file_id) if file_id is not None else None
+        if digest is None:
+            digest = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+        if file_id is not None:
+            current[file_id] = digest
+        digests.append(digest)
+    st.session_state.upload_digests = current  # Sólo interesa la subida actual
+    return digests
+
+def parse_backup_cached(uploaded_file, digest):
+    """Parsea y decodifica un backup, reutilizando el resultado si ya se parseó ese contenido"""
+    cache = st.session_state.setdefault('import_cache', OrderedDict())
+    if digest in cache:
+        cache.move_to_end(digest)
+        return cache[digest]
     
-    # Convertir fechas a formato ISO
-    export_dict = convert_dates_to_iso(export_dict)
-    
-    # Convertir a JSON y comprimir
-    json_str = json.dumps(export_dict, indent=2, ensure_ascii=False, default=json_serial)
-    compressed = gzip.compress(json_str.encode('utf-8'))
+    # Descomprimir, parsear y validar en streaming (NDJSON o JSON antiguo)
+    progress = st.progress(0.0, text="Importando backup...")
+    imported_data, invalid = read_backup(
+        uploaded_file,
+        on_progress=lambda fraction: progress.progress(fraction, text="Importando backup...")
+    )
+    progress.empty()
     
-    # Crear archivo descargable
-    b64 = base64.b64encode(compressed).decode()
-    href = f'<a href="data:application/gzip;base64,{b64}" download="pomodoro_backup.json.gz">Descargar backup</a>'
-    st.markdown(href, unsafe_allow_html=True)
+    # Convertir a objetos fecha sólo los campos de fecha del esquema
+    cache[digest] = (decode_state(imported_data), invalid)
+    while len(cache) > IMPORT_CACHE_SIZE:
+        cache.popitem(last=False)
+    return cache[digest]
+
+def replay_backups(backups):
+    """Reconstruye los datos a partir de un backup completo y su cadena de incrementales.
 
-def import_data(uploaded_file):
-    """Importa datos desde un archivo JSON comprimido (backup local)"""
+    Los incrementales se aplican siguiendo su 'base', sin importar el orden en
+    que se subieron. Devuelve (datos combinados, id del último backup aplicado).
+    """
+    full = [backup for backup in backups if backup.get('kind', 'full') == 'full']
+    if len(full) != 1:
+        raise ValueError("selecciona exactamente un backup completo y sus incrementales")
+    increments = {backup.get('base'): backup for backup in backups if backup.get('kind') == 'incremental'}
+    if len(increments) != len(backups) - 1:
+        raise ValueError("hay varios incrementales sobre el mismo backup")
+
+    merged = dict(full[0])
+    tasks = {task.id: copy.copy(task) for task in merged.get('tasks') or []}
+    sessions = list(merged.get('session_history', []))
+    last_id = merged.get('backup_id')
+    applied = 0
+    while last_id is not None and last_id in increments:
+        step = increments[last_id]
+        if step.get('session_offset') != len(sessions):
+            raise ValueError("cadena incompleta: el incremental no continúa el historial anterior")
+        for task in step.get('tasks') or []:
+            tasks[task.id] = copy.copy(task)
+        for task_id in step.get('deleted_tasks', []):
+            tasks.pop(task_id, None)
+        sessions.extend(step.get('session_history', []))
+        merged.update({key: step[key] for key in ('activities', 'projects', 'achievements', 'settings') if key in step})
+        last_id = step.get('backup_id')
+        applied += 1
+    if applied != len(increments):
+        raise ValueError("cadena incompleta: hay incrementales que no enlazan con el backup completo")
+
+    merged['tasks'] = TaskStore(tasks.values())
+    merged['session_history'] = sessions
+    return merged, last_id
+
+def import_data(uploaded_files):
+    """Importa datos desde backups locales comprimidos (NDJSON o JSON antiguo).
+
+    Acepta un backup completo y, opcionalmente, sus incrementales. Cada
+    subida se aplica una sola vez: mientras los mismos archivos sigan en el
+    selector, los reruns no los vuelven a procesar. Volver a subir el mismo
+    backup (otra subida, otro file_id) sí lo restaura de nuevo.
+    """
     try:
-        # Descomprimir y cargar
-        compressed = uploaded_file.read()
-        json_str = gzip.decompress(compressed).decode('utf-8')
-        imported_data = json.loads(json_str)
+        digests = upload_digests(uploaded_files)
+        upload = tuple(sorted(getattr(uploaded_file, 'file_id', None) or digest
+                              for uploaded_file, digest in zip(uploaded_files, digests)))
+        if st.session_state.get('last_import_upload') == upload:
+            st.caption("✅ Este backup ya está importado")
+            return
+        
+        parsed = [parse_backup_cached(uploaded_file, file_digest)
+                  for uploaded_file, file_digest in zip(uploaded_files, digests)]
+        imported_data, backup_id = replay_backups([data for data, _ in parsed])
+        invalid = sum(count for _, count in parsed)
         
-        # Convertir cadenas ISO a objetos fecha
-        imported_data = convert_iso_to_dates(imported_data)
+        # Reemplazar el historial guardado por el importado antes de tocar el estado:
+        # si falla, la tabla y lo que se muestra siguen coincidiendo
+        if check_authentication():
+            init_session_store().replace(st.session_state.username, imported_data['session_history'])
         
-        # Actualizar estado
+        # Actualizar estado (copias de lo que se modifica, el resultado parseado queda en caché)
         state = st.session_state.pomodoro_state
-        state['activities'] = imported_data.get('activities', [])
-        state['tasks'] = imported_data.get('tasks', [])
-        state['completed_tasks'] = imported_data.get('completed_tasks', [])
-        state['projects'] = imported_data.get('projects', [])
-        state['achievements'] = imported_data.get('achievements', state['achievements'])
-        state['session_history'] = imported_data.get('session_history', [])
+        state['activities'] = list(imported_data.get('activities', []))
+        state['tasks'] = imported_data['tasks']
+        state['projects'] = [copy.copy(project) for project in imported_data.get('projects', [])]
+        state['achievements'] = dict(imported_data.get('achievements', state['achievements']))
+        state['session_history'] = imported_data['session_history']
+        state['history_skipped'] = 0
+        bump_history_version(state)
+        state['rollups'] = rebuild_rollups(state['session_history'])
+        sync_streak(state)
+        
+        # El estado coincide con el último backup de la cadena: los incrementales siguientes parten de él
+        state['backup_watermark'] = make_watermark(backup_id, task_fingerprints(state['tasks']),
+                                                   len(state['session_history'])) if backup_id else None
         
         # Configuración
         settings = imported_data.get('settings', {})
@@ -451,6 +1644,13 @@ def import_data(uploaded_file):
         state['total_sessions'] = settings.get('total_sessions', 8)
         state['current_theme'] = settings.get('current_theme', 'Claro')
         
+        st.session_state.last_import_upload = upload
+        # Ya aplicado: el guardián de arriba evita volver a parsearlo, no hace falta conservarlo
+        cache = st.session_state.get('import_cache', {})
+        for file_digest in digests:
+            cache.pop(file_digest, None)
+        if invalid:
+            st.warning(f"Se descartaron {invalid} registros no válidos del backup")
         st.success("Datos importados correctamente!")
         st.session_state.force_rerun = True
     except Exception as e:
@@ -466,140 +1666,236 @@ def log_session():
     if state['total_active_time'] >= 0.1:
         # Convertir a horas en lugar de minutos
         hours = round(state['total_active_time'] / 3600, 2)  # Cambiado de minutos a horas
-        log_entry = {
-            'Fecha': datetime.datetime.now().strftime("%Y-%m-%d"),
-            'Hora Inicio': state['start_time'].strftime("%H:%M:%S") if state['start_time'] else datetime.datetime.now().strftime("%H:%M:%S"),
-            'Tiempo Activo (horas)': hours,  # Cambiado de minutos a horas
-            'Actividad': state['current_activity'],
-            'Proyecto': state['current_project'],
-            'Tarea': state.get('current_task', '')
-        }
+        log_entry = SessionRecord(
+            date=date.today(),
+            start=state['start_time'].strftime("%H:%M:%S") if state['start_time'] else datetime.datetime.now().strftime("%H:%M:%S"),
+            hours=hours,  # Cambiado de minutos a horas
+            activity=state['current_activity'],
+            project=state['current_project'],
+            task=state.get('current_task', '')
+        )
         
-        # Guardar en el historial de sesiones
+        # Guardar en el historial de sesiones (una sola fila nueva en la tabla sessions)
         state['session_history'].append(log_entry)
+        bump_history_version(state)
+        update_rollups(state.setdefault('rollups', empty_rollups()), log_entry)
+        if check_authentication():
+            try:
+                init_session_store().append(st.session_state.username, log_entry)
+            except Exception as e:
+                st.error(f"Error al registrar la sesión: {str(e)}")
         
         # Actualizar logros
         if state['current_phase'] == "Trabajo":
             state['achievements']['pomodoros_completed'] += 1
             state['achievements']['total_hours'] += hours  # Ya está en horas
             
-            # Verificar racha diaria
-            today = date.today()
-            if state['last_session_date'] != today:
-                if state['last_session_date'] and (today - state['last_session_date']).days == 1:
-                    state['achievements']['streak_days'] += 1
-                elif not state['last_session_date']:
-                    state['achievements']['streak_days'] = 1
-                else:
-                    state['achievements']['streak_days'] = 1
-                state['last_session_date'] = today
+            # Racha diaria (derivada de los totales por día)
+            sync_streak(state)
         
         # Guardar cambios en Supabase
         save_to_supabase()
 
-@st.cache_data(ttl=300)
-def analyze_data():
-    """Analiza los datos del historial de sesiones"""
-    data = {
-        'activities': defaultdict(float),
-        'projects': defaultdict(float),
-        'tasks': defaultdict(float),
-        'daily_total': defaultdict(float),
-        'raw_data': [],
-        'errors': []  # Para rastrear errores en el procesamiento
-    }
-    
-    for i, entry in enumerate(st.session_state.pomodoro_state['session_history']):
-        try:
-            # Depuración: mostrar información de la entrada
-            print(f"Procesando entrada {i}: {entry}")
-            
-            # Parsear fecha (manejar tanto strings como objetos date)
-            fecha = entry['Fecha']
-            if isinstance(fecha, str):
-                date_obj = datetime.datetime.strptime(fecha, "%Y-%m-%d").date()
-                print(f"  Fecha como string: {fecha} -> {date_obj}")
-            elif isinstance(fecha, (datetime.date, datetime.datetime)):
-                date_obj = fecha if isinstance(fecha, datetime.date) else fecha.date()
-                print(f"  Fecha como objeto: {fecha} -> {date_obj}")
-            else:
-                raise ValueError(f"Tipo de fecha no reconocido: {type(fecha)}")
-            
-            # Parsear hora de inicio
-            hora_inicio = entry.get('Hora Inicio', '00:00:00')
-            if isinstance(hora_inicio, str) and ':' in hora_inicio:
-                hour_parts = hora_inicio.split(':')
-                hour = int(hour_parts[0])
-            elif isinstance(hora_inicio, datetime.time):
-                hour = hora_inicio.hour
-            else:
-                hour = 0
-            
-            # Obtener duración (manejar diferentes formatos)
-            duration = 0
-            if 'Tiempo Activo (min)' in entry:
-                duration = float(entry['Tiempo Activo (min)']) / 60  # Convertir minutos a horas
-                print(f"  Duración en minutos: {entry['Tiempo Activo (min)']} -> {duration} horas")
-            elif 'Tiempo Activo (horas)' in entry:
-                duration = float(entry['Tiempo Activo (horas)'])
-                print(f"  Duración en horas: {duration}")
-            else:
-                print(f"  No se encontró campo de duración en la entrada {i}")
-                
-            activity = entry.get('Actividad', '').strip()
-            project = entry.get('Proyecto', '').strip()
-            task = entry.get('Tarea', '').strip()
+# Columnas del DataFrame normalizado de sesiones
+SESSION_COLUMNS = ['date', 'hour', 'duration', 'activity', 'project', 'task']
 
-            print(f"  Actividad: {activity}, Proyecto: {project}, Tarea: {task}")
+def build_sessions_frame(history):
+    """Convierte session_history (lista de SessionRecord) en un DataFrame tipado.
 
-            # Acumular datos
-            data['activities'][activity] += duration
-            if project:
-                data['projects'][project] += duration
-            if task:
-                data['tasks'][task] += duration
-            data['daily_total'][entry['Fecha']] += duration
-            
-            # Guardar datos crudos
-            data['raw_data'].append({
-                'date': date_obj, 
-                'hour': hour, 
-                'duration': duration, 
-                'activity': activity,
-                'project': project, 
-                'task': task
-            })
-            
-            print(f"  Entrada {i} procesada correctamente")
-            
-        except Exception as e:
-            error_msg = f"Error procesando entrada {i}: {e}"
-            print(error_msg)
-            data['errors'].append(error_msg)
-    
-    # Depuración: mostrar resumen
-    print(f"Total de entradas procesadas: {len(data['raw_data'])}")
-    print(f"Total de errores: {len(data['errors'])}")
-    print(f"Tiempo total en actividades: {sum(data['activities'].values())} horas")
+    Los registros ya vienen validados por decode_state, así que cada columna
+    se construye directamente a partir de los atributos.
+    """
+    return pd.DataFrame({
+        'date': pd.Series(np.array([s.date for s in history], dtype='datetime64[D]'),
+                          dtype='datetime64[ns]'),
+        'hour': pd.Series([s.hour for s in history], dtype='int8'),
+        'duration': pd.Series([s.hours for s in history], dtype='float64'),
+        'activity': pd.Series([s.activity for s in history], dtype=object),
+        'project': pd.Series([s.project for s in history], dtype=object),
+        'task': pd.Series([s.task for s in history], dtype=object)
+    }, columns=SESSION_COLUMNS)
+
+def build_sessions_parquet(frame):
+    """Exporta el DataFrame normalizado de sesiones a Parquet.
+
+    Se escribe tal cual desde las columnas tipadas (fecha como date32, hora
+    int8, duración float64); las columnas de texto quedan codificadas como
+    diccionario y el archivo se comprime con zstd.
+    """
+    with log_timing("build_sessions_parquet", entradas=len(frame)) as details:
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        table = table.set_column(SESSION_COLUMNS.index('date'), 'date', table.column('date').cast(pa.date32()))
+        buffer = io.BytesIO()
+        pq.write_table(table, buffer, compression='zstd')
+        details.update(bytes=buffer.tell())
+        return buffer.getvalue()
+
+@st.cache_data(max_entries=100)
+def analyze_data(username, history_version, _history):
+    """Analiza los datos del historial de sesiones.
+
+    La caché se indexa por usuario y versión del historial; `_history` no se
+    hashea (por eso el guion bajo) y debe corresponder a esa versión.
+    """
+    with log_timing("analyze_data", usuario=username, entradas=len(_history)) as details:
+        log_sampled_entries("Entrada", _history)
+        frame = build_sessions_frame(_history)
+
+        with_project = frame[frame['project'] != '']
+        with_task = frame[frame['task'] != '']
+        data = {
+            'frame': frame,
+            'activities': frame.groupby('activity')['duration'].sum().to_dict(),
+            'projects': with_project.groupby('project')['duration'].sum().to_dict(),
+            'tasks': with_task.groupby('task')['duration'].sum().to_dict(),
+            'daily_total': frame.groupby('date')['duration'].sum()
+        }
+
+        details.update(procesadas=len(frame), horas=round(float(frame['duration'].sum()), 2))
     
     return data
     
+# ==============================================
+# Totales incrementales del historial (rollups)
+# ==============================================
+
+def empty_rollups():
+    """Devuelve unos totales vacíos del historial de sesiones"""
+    return {
+        'entries': 0,              # Entradas del historial ya contabilizadas
+        'sessions': 0,
+        'total_hours': 0.0,
+        'activities': {},          # actividad -> horas
+        'projects': {},            # proyecto -> horas
+        'tasks': {},               # tarea -> horas
+        'activity_projects': {},   # actividad -> {proyecto -> horas}
+        'hours': {},               # hora del día ('0'..'23') -> horas
+        'days': {},                # 'YYYY-MM-DD' -> {'sessions': n, 'hours': h}
+        'streak': 0,               # Días seguidos con sesiones que terminan en streak_end
+        'streak_end': None         # Último día ('YYYY-MM-DD') con sesiones
+    }
+
+def streak_from_days(days):
+    """Calcula (último día, días seguidos hasta él) a partir del mapa de días"""
+    if not days:
+        return None, 0
+    end = max(days)
+    day = date.fromisoformat(end)
+    length = 0
+    while day.isoformat() in days:
+        length += 1
+        day -= timedelta(days=1)
+    return end, length
+
+def advance_streak(rollups, day):
+    """Actualiza la racha al registrar una sesión en `day`"""
+    end = rollups['streak_end']
+    if end is None or day > date.fromisoformat(end) + timedelta(days=1):
+        rollups['streak'], rollups['streak_end'] = 1, day.isoformat()
+    elif day == date.fromisoformat(end) + timedelta(days=1):
+        rollups['streak'], rollups['streak_end'] = rollups['streak'] + 1, day.isoformat()
+    elif day < date.fromisoformat(end):
+        # Sesión con fecha anterior (importada): puede unir dos rachas
+        rollups['streak_end'], rollups['streak'] = streak_from_days(rollups['days'])
+
+def current_streak(rollups, today=None):
+    """Racha vigente: sólo cuenta si la última sesión fue hoy o ayer"""
+    today = today or date.today()
+    end = rollups.get('streak_end')
+    if end is None or date.fromisoformat(end) < today - timedelta(days=1):
+        return 0
+    return rollups['streak']
+
+def sessions_on(rollups, day):
+    """Número de sesiones registradas en un día"""
+    return rollups['days'].get(day.isoformat(), {}).get('sessions', 0)
+
+def sync_streak(state):
+    """Deriva la racha y la fecha de la última sesión de los totales por día"""
+    rollups = ensure_rollups(state)
+    state['achievements']['streak_days'] = current_streak(rollups)
+    if rollups['streak_end']:
+        state['last_session_date'] = date.fromisoformat(rollups['streak_end'])
+
+def update_rollups(rollups, entry):
+    """Suma una sesión a los totales en O(1)"""
+    rollups['entries'] += 1
+    duration = entry.hours
+    activity, project, task = entry.activity, entry.project, entry.task
+
+    rollups['sessions'] += 1
+    rollups['total_hours'] += duration
+    rollups['activities'][activity] = rollups['activities'].get(activity, 0.0) + duration
+    if project:
+        rollups['projects'][project] = rollups['projects'].get(project, 0.0) + duration
+        if activity:
+            by_project = rollups['activity_projects'].setdefault(activity, {})
+            by_project[project] = by_project.get(project, 0.0) + duration
+    if task:
+        rollups['tasks'][task] = rollups['tasks'].get(task, 0.0) + duration
+    hour = str(entry.hour)
+    rollups['hours'][hour] = rollups['hours'].get(hour, 0.0) + duration
+    day_totals = rollups['days'].setdefault(entry.date.isoformat(), {'sessions': 0, 'hours': 0.0})
+    day_totals['sessions'] += 1
+    day_totals['hours'] += duration
+    advance_streak(rollups, entry.date)
+
+def rebuild_rollups(history):
+    """Recalcula todos los totales a partir del historial completo"""
+    with log_timing("rebuild_rollups", entradas=len(history)):
+        frame = build_sessions_frame(history)
+        rollups = empty_rollups()
+        rollups['entries'] = len(history)
+        if frame.empty:
+            return rollups
+
+        with_project = frame[frame['project'] != '']
+        labelled = with_project[with_project['activity'] != '']
+        by_day = frame.groupby('date')['duration'].agg(['size', 'sum'])
+
+        rollups['sessions'] = len(frame)
+        rollups['total_hours'] = float(frame['duration'].sum())
+        rollups['activities'] = frame.groupby('activity')['duration'].sum().to_dict()
+        rollups['projects'] = with_project.groupby('project')['duration'].sum().to_dict()
+        rollups['tasks'] = frame[frame['task'] != ''].groupby('task')['duration'].sum().to_dict()
+        rollups['activity_projects'] = {
+            activity: group.groupby('project')['duration'].sum().to_dict()
+            for activity, group in labelled.groupby('activity')
+        }
+        rollups['hours'] = {
+            str(hour): total for hour, total in frame.groupby('hour')['duration'].sum().items()
+        }
+        rollups['days'] = {
+            day.strftime("%Y-%m-%d"): {'sessions': int(row['size']), 'hours': float(row['sum'])}
+            for day, row in by_day.iterrows()
+        }
+        rollups['streak_end'], rollups['streak'] = streak_from_days(rollups['days'])
+        return rollups
+
+def ensure_rollups(state):
+    """Reconstruye los totales si no existen o no cuadran con el historial"""
+    rollups = state.get('rollups')
+    if (not rollups or 'streak' not in rollups
+            or rollups.get('entries') != len(state['session_history']) + state.get('history_skipped', 0)):
+        state['rollups'] = rebuild_rollups(load_full_history(state))
+    return state['rollups']
+
 def on_close():
     """Función que se ejecuta al cerrar la aplicación"""
     if check_authentication():
         # Verificar si el timer estaba corriendo y si hay un start_time válido
         state = st.session_state.pomodoro_state
-        if state['timer_running'] and state['start_time'] is not None:
-            # Calcular el tiempo activo hasta el momento de cierre
-            current_elapsed = time.time() - state['start_time'].timestamp()
-            state['total_active_time'] += current_elapsed
+        if state['timer_running']:
+            # Congelar el tiempo activo hasta el momento de cierre
+            state['remaining_time'] = get_remaining_time(state)
+            stop_timer(state)
         
         # Solo registrar si fue fase de trabajo y hay tiempo acumulado
         if state['current_phase'] == "Trabajo" and state['total_active_time'] >= 0.1:
             log_session()
         
-        # Guardar el estado en Supabase
-        save_to_supabase()
+        # Guardar el estado en Supabase y vaciar la cola antes de salir
+        save_to_supabase(immediate=True)
 
 def logout():
     """Cierra sesión limpiando todo"""
@@ -615,19 +1911,12 @@ def logout():
 # Funciones de gestión de tareas (Mejoradas)
 # ==============================================
 
-def complete_task(task):
+def complete_task(task_id):
     """Marca una tarea como completada y guarda en Supabase"""
     state = st.session_state.pomodoro_state
     
-    # Encontrar la tarea en la lista de tareas pendientes
-    for t in state['tasks']:
-        if t['name'] == task['name'] and t['project'] == task['project']:
-            t['completed'] = True
-            t['completed_date'] = date.today()
-            state['tasks'].remove(t)
-            state['completed_tasks'].append(t)
-            state['achievements']['tasks_completed'] += 1
-            break
+    if state['tasks'].complete(task_id):
+        state['achievements']['tasks_completed'] += 1
     
     # Guardar cambios
     save_to_supabase()
@@ -637,48 +1926,47 @@ def complete_task(task):
 def edit_task_modal():
     """Muestra el modal para editar una tarea"""
     state = st.session_state.pomodoro_state
-    if state.get('editing_task'):
-        task = state['editing_task']
-        
+    task = state['tasks'].get(state.get('editing_task'))
+    if task:
         with st.form("edit_task_form"):
             st.subheader("✏️ Editar Tarea")
             
-            new_name = st.text_input("Nombre", value=task['name'])
+            new_name = st.text_input("Nombre", value=task.name)
             
             # Obtener actividad actual del proyecto de la tarea
-            current_project = next((p for p in state['projects'] if p['name'] == task['project']), None)
-            current_activity = current_project['activity'] if current_project else task.get('activity', '')
+            current_project = next((p for p in state['projects'] if p.name == task.project), None)
+            current_activity = current_project.activity if current_project else task.activity
             
             # Proyectos disponibles para la actividad actual
-            available_projects = [p['name'] for p in state['projects'] if p['activity'] == current_activity]
+            available_projects = [p.name for p in state['projects'] if p.activity == current_activity]
             new_project = st.selectbox(
                 "Proyecto",
                 ["Ninguno"] + available_projects,
-                index=(["Ninguno"] + available_projects).index(task['project']) if task['project'] in ["Ninguno"] + available_projects else 0
+                index=(["Ninguno"] + available_projects).index(task.project) if task.project in ["Ninguno"] + available_projects else 0
             )
             
             new_priority = st.selectbox(
                 "Prioridad",
                 ["Baja", "Media", "Alta", "Urgente"],
-                index=["Baja", "Media", "Alta", "Urgente"].index(task['priority'])
+                index=["Baja", "Media", "Alta", "Urgente"].index(task.priority)
             )
             
-            new_deadline = st.date_input("Fecha límite", value=task['deadline'])
+            new_deadline = st.date_input("Fecha límite", value=task.deadline)
             
             col1, col2 = st.columns(2)
             with col1:
                 if st.form_submit_button("💾 Guardar"):
-                    # Actualizar la tarea
-                    task['name'] = new_name
-                    task['project'] = new_project
-                    task['priority'] = new_priority
-                    task['deadline'] = new_deadline
-                    
                     # Si cambió el proyecto, actualizar la actividad
+                    new_activity = task.activity
                     if new_project != "Ninguno":
-                        project = next((p for p in state['projects'] if p['name'] == new_project), None)
+                        project = next((p for p in state['projects'] if p.name == new_project), None)
                         if project:
-                            task['activity'] = project['activity']
+                            new_activity = project.activity
+                    
+                    # Actualizar la tarea
+                    state['tasks'].update(task.id, name=new_name, project=new_project,
+                                          activity=new_activity, priority=new_priority,
+                                          deadline=new_deadline)
                     
                     st.success("Tarea actualizada!")
                     state['editing_task'] = None
@@ -698,28 +1986,25 @@ def edit_project_modal():
         with st.form("edit_project_form"):
             st.subheader("✏️ Editar Proyecto")
             
-            new_name = st.text_input("Nombre", value=project['name'])
+            new_name = st.text_input("Nombre", value=project.name)
             new_activity = st.selectbox(
                 "Actividad",
                 state['activities'],
-                index=state['activities'].index(project['activity']) if project['activity'] in state['activities'] else 0
+                index=state['activities'].index(project.activity) if project.activity in state['activities'] else 0
             )
             
             col1, col2 = st.columns(2)
             with col1:
                 if st.form_submit_button("💾 Guardar"):
-                    old_name = project['name']
-                    old_activity = project['activity']
+                    old_name = project.name
+                    old_activity = project.activity
                     
                     # Actualizar el proyecto
-                    project['name'] = new_name
-                    project['activity'] = new_activity
+                    project.name = new_name
+                    project.activity = new_activity
                     
                     # Actualizar tareas asociadas
-                    for task in state['tasks'] + state['completed_tasks']:
-                        if task['project'] == old_name and task.get('activity') == old_activity:
-                            task['project'] = new_name
-                            task['activity'] = new_activity
+                    state['tasks'].rename_project(old_name, old_activity, new_name, new_activity)
                     
                     st.success("Proyecto actualizado!")
                     state['editing_project'] = None
@@ -734,6 +2019,13 @@ def edit_project_modal():
 # Funciones de visualización (Mejoradas)
 # ==============================================
 
+def group_projects(projects):
+    """Agrupa los proyectos por actividad"""
+    grouped = {}
+    for project in projects:
+        grouped.setdefault(project.activity, []).append(project)
+    return grouped
+
 def hierarchical_view():
     """Muestra la vista jerárquica de actividades, proyectos y tareas"""
     state = st.session_state.pomodoro_state
@@ -754,11 +2046,11 @@ def hierarchical_view():
             )
             if st.button("Crear Proyecto", key="create_project"):
                 if new_project_name:
-                    if new_project_name not in [p['name'] for p in state['projects']]:
-                        state['projects'].append({
-                            'name': new_project_name,
-                            'activity': new_project_activity
-                        })
+                    if new_project_name not in [p.name for p in state['projects']]:
+                        state['projects'].append(Project(
+                            name=new_project_name,
+                            activity=new_project_activity
+                        ))
                         st.success("Proyecto creado!")
                         st.session_state.force_rerun = True
                     else:
@@ -769,7 +2061,7 @@ def hierarchical_view():
             new_task_name = st.text_input("Nombre de la tarea", key="new_task_name")
             new_task_project = st.selectbox(
                 "Proyecto",
-                [p['name'] for p in state['projects']] + ["Ninguno"],
+                [p.name for p in state['projects']] + ["Ninguno"],
                 key="new_task_project"
             )
             new_task_priority = st.selectbox(
@@ -785,24 +2077,26 @@ def hierarchical_view():
             )
             if st.button("Crear Tarea", key="create_task"):
                 if new_task_name:
-                    new_task = {
-                        'name': new_task_name,
-                        'project': new_task_project,
-                        'activity': next((p['activity'] for p in state['projects'] if p['name'] == new_task_project), ""),
-                        'priority': new_task_priority,
-                        'deadline': new_task_deadline,
-                        'completed': False,
-                        'created': date.today()
-                    }
-                    state['tasks'].append(new_task)
+                    new_task = Task(
+                        name=new_task_name,
+                        project=new_task_project,
+                        activity=next((p.activity for p in state['projects'] if p.name == new_task_project), ""),
+                        priority=new_task_priority,
+                        deadline=new_task_deadline,
+                        completed=False,
+                        created=date.today()
+                    )
+                    state['tasks'].add(new_task)
                     st.success("Tarea creada!")
                     st.session_state.force_rerun = True
 
-    # Mostrar estructura jerárquica
+    # Mostrar estructura jerárquica (proyectos agrupados en una sola pasada;
+    # las tareas pendientes salen del índice actividad -> proyecto del almacén)
+    projects_by_activity = group_projects(state['projects'])
     for activity in state['activities']:
         with st.expander(f"📁 {activity}", expanded=True):
             # Proyectos de esta actividad
-            activity_projects = [p for p in state['projects'] if p['activity'] == activity]
+            activity_projects = projects_by_activity.get(activity, [])
             
             if not activity_projects:
                 st.info("No hay proyectos en esta actividad")
@@ -810,13 +2104,10 @@ def hierarchical_view():
                 for project in activity_projects:
                     col1, col2 = st.columns([5, 1])
                     with col1:
-                        st.write(f"📂 **{project['name']}**")
+                        st.write(f"📂 **{project.name}**")
                         
                         # Tareas de este proyecto
-                        project_tasks = [t for t in state['tasks'] 
-                                       if not t['completed'] 
-                                       and t['project'] == project['name'] 
-                                       and t.get('activity') == activity]
+                        project_tasks = state['tasks'].pending_in(activity, project.name)
                         
                         if not project_tasks:
                             st.write("  └ No hay tareas pendientes")
@@ -824,105 +2115,411 @@ def hierarchical_view():
                             for task in project_tasks:
                                 cols = st.columns([5, 1, 1])
                                 with cols[0]:
-                                    st.write(f"  └ {task['name']} ({task['priority']}) - Vence: {task['deadline']}")
+                                    st.write(f"  └ {task.name} ({task.priority}) - Vence: {task.deadline}")
                                 with cols[1]:
-                                    if st.button("✏️", key=f"edit_task_{task['name']}_{project['name']}"):
-                                        state['editing_task'] = task
+                                    if st.button("✏️", key=f"edit_task_{task.id}"):
+                                        state['editing_task'] = task.id
                                         st.session_state.force_rerun = True
                                 with cols[2]:
-                                    if st.button("✓", key=f"complete_{task['name']}_{project['name']}"):
-                                        task['completed'] = True
-                                        task['completed_date'] = date.today()
-                                        state['tasks'].remove(task)
-                                        state['completed_tasks'].append(task)
-                                        state['achievements']['tasks_completed'] += 1
+                                    if st.button("✓", key=f"complete_task_{task.id}"):
+                                        if state['tasks'].complete(task.id):
+                                            state['achievements']['tasks_completed'] += 1
                                         st.success("Tarea completada!")
                                         st.session_state.force_rerun = True
                     
                     with col2:
-                        if st.button("✏️", key=f"edit_proj_{project['name']}"):
+                        if st.button("✏️", key=f"edit_proj_{project.name}"):
                             state['editing_project'] = project
                             st.session_state.force_rerun = True
-                        if st.button("🗑️", key=f"delete_proj_{project['name']}"):
+                        if st.button("🗑️", key=f"delete_proj_{project.name}"):
                             # Mover tareas a "Ninguno" antes de eliminar
-                            for task in state['tasks'] + state['completed_tasks']:
-                                if task['project'] == project['name']:
-                                    task['project'] = "Ninguno"
+                            state['tasks'].detach_project(project.name)
                             state['projects'].remove(project)
                             st.success("Proyecto eliminado!")
                             st.session_state.force_rerun = True
 
 def filter_tasks(activity_filter="Todas", project_filter="Todos", status_filter="Todas"):
-    """Filtra tareas según los criterios especificados"""
+    """Filtra tareas según los criterios especificados (memorizado por versión del almacén)"""
     state = st.session_state.pomodoro_state
-    filtered_tasks = []
-    
-    for task in state['tasks'] + state['completed_tasks']:
-        # Filtrar por actividad
-        if activity_filter != "Todas" and task.get('activity') != activity_filter:
-            continue
-            
-        # Filtrar por proyecto
-        if project_filter != "Todos" and task['project'] != project_filter:
-            continue
-            
-        # Filtrar por estado
-        if status_filter == "Pendientes" and task['completed']:
-            continue
-        if status_filter == "Completadas" and not task['completed']:
-            continue
-            
-        filtered_tasks.append(task)
-    
-    return filtered_tasks
+    completed = {"Pendientes": False, "Completadas": True}.get(status_filter)
+    return state['tasks'].filter(
+        activity=None if activity_filter == "Todas" else activity_filter,
+        project=None if project_filter == "Todos" else project_filter,
+        completed=completed
+    )
+
+# Paginación de la lista de tareas: sólo se crean los widgets de una página
+TASK_PAGE_SIZES = [10, 25, 50]
+PRIORITY_ORDER = {"Urgente": 0, "Alta": 1, "Media": 2, "Baja": 3}
+
+def _deadline_key(task):
+    """Ordena por fecha límite, dejando al final las tareas sin fecha (o con una no válida)"""
+    deadline = TaskStore.due_date(task)
+    return (deadline is None, deadline or date.max)
+
+TASK_SORT_KEYS = {
+    "Creación": None,  # Orden de inserción del almacén
+    "Fecha límite": _deadline_key,
+    "Prioridad": lambda task: (PRIORITY_ORDER.get(task.priority, len(PRIORITY_ORDER)), _deadline_key(task))
+}
+
+def paginate_tasks(tasks, sort_by, page, page_size):
+    """Ordena las tareas y devuelve (tareas de la página, página ajustada, total de páginas)"""
+    sort_key = TASK_SORT_KEYS.get(sort_by)
+    if sort_key is not None:
+        tasks = sorted(tasks, key=sort_key)
+    pages = max(1, -(-len(tasks) // page_size))
+    page = min(max(1, page), pages)
+    start = (page - 1) * page_size
+    return tasks[start:start + page_size], page, pages
+
+BULK_ACTIONS = ["Completar", "Mover a proyecto", "Cambiar prioridad", "Eliminar"]
+
+def apply_bulk_action(task_ids, action, target=None):
+    """Aplica una acción a varias tareas con una sola modificación del almacén y un solo guardado"""
+    state = st.session_state.pomodoro_state
+    store = state['tasks']
+    with log_timing("bulk_tasks", accion=action, tareas=len(task_ids)) as details:
+        if action == "Completar":
+            changed = store.complete_many(task_ids)
+            state['achievements']['tasks_completed'] += changed
+        elif action == "Mover a proyecto":
+            project = next((p for p in state['projects'] if p.name == target), None)
+            if project:
+                changed = store.update_many(task_ids, project=project.name, activity=project.activity)
+            else:
+                changed = store.update_many(task_ids, project="Ninguno")
+        elif action == "Cambiar prioridad":
+            changed = store.update_many(task_ids, priority=target)
+        else:
+            changed = store.remove_many(task_ids)
+        details.update(modificadas=changed)
+    save_to_supabase()
+    return changed
+
+def toggle_bulk_selection(task_id, key):
+    """Añade o quita una tarea de la selección en bloque al marcar su casilla"""
+    selected = st.session_state.setdefault('bulk_selected', set())
+    if st.session_state[key]:
+        selected.add(task_id)
+    else:
+        selected.discard(task_id)
+
+def bulk_actions(filtered_tasks):
+    """Muestra el panel para aplicar una acción a las tareas seleccionadas.
+
+    Las tareas se marcan con la casilla de cada fila de la página visible (la
+    selección se conserva al cambiar de página) o todas las filtradas a la vez.
+    Devuelve si está activa la selección de todas las filtradas.
+    """
+    state = st.session_state.pomodoro_state
+    with st.expander("🧰 Acciones en bloque", expanded=False):
+        # La ronda cambia tras aplicar una acción para vaciar la selección
+        bulk_round = st.session_state.get('bulk_round', 0)
+        select_all = st.checkbox(f"Seleccionar todas las filtradas ({len(filtered_tasks)})", key=f"bulk_all_{bulk_round}")
+        if select_all:
+            selected_ids = [task.id for task in filtered_tasks]
+        else:
+            selected = st.session_state.get('bulk_selected', set())
+            selected_ids = [task.id for task in filtered_tasks if task.id in selected] if selected else []
+            st.caption("Marca las tareas con la casilla de cada fila")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            action = st.selectbox("Acción", BULK_ACTIONS, key="bulk_action")
+        target = None
+        with col2:
+            if action == "Mover a proyecto":
+                target = st.selectbox("Proyecto destino", [p.name for p in state['projects']] + ["Ninguno"], key="bulk_project")
+            elif action == "Cambiar prioridad":
+                target = st.selectbox("Nueva prioridad", list(PRIORITY_ORDER), key="bulk_priority")
+        
+        confirmed = True
+        if action == "Eliminar" and selected_ids:
+            confirmed = st.checkbox(f"Confirmo que quiero eliminar {len(selected_ids)} tareas (no se puede deshacer)",
+                                    key=f"bulk_confirm_{bulk_round}")
+        
+        if st.button(f"Aplicar a {len(selected_ids)} tareas", key="bulk_apply",
+                     disabled=not selected_ids or not confirmed):
+            changed = apply_bulk_action(selected_ids, action, target)
+            st.session_state.bulk_round = bulk_round + 1
+            st.session_state.bulk_selected = set()
+            st.success(f"{action}: {changed} tareas actualizadas")
+            st.session_state.force_rerun = True
+    return select_all
 
 def display_filtered_tasks(filter_activity, filter_project, task_status):
     """Muestra tareas filtradas con claves únicas para botones"""
+    state = st.session_state.pomodoro_state
     filtered_tasks = filter_tasks(filter_activity, filter_project, task_status)
     
     # Mostrar tareas filtradas
     if not filtered_tasks:
         st.info("No hay tareas que coincidan con los filtros")
     else:
-        for i, task in enumerate(filtered_tasks):
+        select_all = bulk_actions(filtered_tasks)
+        bulk_round = st.session_state.get('bulk_round', 0)
+        bulk_selected = st.session_state.get('bulk_selected', set())
+        
+        # Controles de orden y paginación
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            sort_options = list(TASK_SORT_KEYS)
+            state['task_sort'] = st.selectbox(
+                "Ordenar por",
+                sort_options,
+                index=sort_options.index(state.get('task_sort', "Creación")) if state.get('task_sort') in sort_options else 0,
+                key="task_sort_selector"
+            )
+        with col2:
+            state['task_page_size'] = st.selectbox(
+                "Tareas por página",
+                TASK_PAGE_SIZES,
+                index=TASK_PAGE_SIZES.index(state.get('task_page_size', 10)) if state.get('task_page_size') in TASK_PAGE_SIZES else 0,
+                key="task_page_size_selector"
+            )
+        page_tasks, page, pages = paginate_tasks(filtered_tasks, state['task_sort'],
+                                                 st.session_state.get('task_page', 1), state['task_page_size'])
+        # Ajustar la página si los filtros reducen el número de páginas
+        st.session_state.task_page = page
+        with col3:
+            st.number_input("Página", min_value=1, max_value=pages, step=1, key="task_page")
+        
+        first = (page - 1) * state['task_page_size'] + 1
+        st.caption(f"Mostrando {first}–{first + len(page_tasks) - 1} de {len(filtered_tasks)} tareas (página {page} de {pages})")
+        
+        for task in page_tasks:
             with st.container(border=True):
-                cols = st.columns([4, 1, 1, 1])
+                cols = st.columns([0.5, 4, 1, 1, 1])
                 with cols[0]:
-                    status = "✅ " if task['completed'] else "📝 "
-                    st.write(f"{status}**{task['name']}**")
-                    st.caption(f"Proyecto: {task['project']} | Prioridad: {task['priority']} | Vence: {task['deadline']}")
+                    select_key = f"select_{task.id}_{bulk_round}_{int(select_all)}"
+                    st.checkbox(
+                        "Seleccionar", value=select_all or task.id in bulk_selected,
+                        key=select_key, disabled=select_all, label_visibility="collapsed",
+                        on_change=toggle_bulk_selection, args=(task.id, select_key)
+                    )
                 
                 with cols[1]:
-                    if st.button("✏️", key=f"edit_{i}_{task['name']}_{task['project']}"):
-                        st.session_state.pomodoro_state['editing_task'] = task
-                        st.session_state.force_rerun = True
+                    status = "✅ " if task.completed else "📝 "
+                    st.write(f"{status}**{task.name}**")
+                    st.caption(f"Proyecto: {task.project} | Prioridad: {task.priority} | Vence: {task.deadline}")
                 
                 with cols[2]:
-                    if not task['completed']:
-                        if st.button("✓", key=f"complete_{i}_{task['name']}_{task['project']}"):
-                            task['completed'] = True
-                            task['completed_date'] = date.today()
-                            # Encontrar y eliminar la tarea de la lista original
-                            for t in st.session_state.pomodoro_state['tasks']:
-                                if t['name'] == task['name'] and t['project'] == task['project']:
-                                    st.session_state.pomodoro_state['tasks'].remove(t)
-                                    break
-                            st.session_state.pomodoro_state['completed_tasks'].append(task)
-                            st.session_state.pomodoro_state['achievements']['tasks_completed'] += 1
+                    if st.button("✏️", key=f"edit_{task.id}"):
+                        state['editing_task'] = task.id
+                        st.session_state.force_rerun = True
+                
+                with cols[3]:
+                    if not task.completed:
+                        if st.button("✓", key=f"complete_{task.id}"):
+                            if state['tasks'].complete(task.id):
+                                state['achievements']['tasks_completed'] += 1
                             st.success("Tarea completada!")
                             st.session_state.force_rerun = True
                     else:
                         st.write("✅")
                 
-                with cols[3]:
-                    if st.button("🗑️", key=f"delete_{i}_{task['name']}_{task['project']}"):
-                        if task['completed']:
-                            st.session_state.pomodoro_state['completed_tasks'].remove(task)
-                        else:
-                            st.session_state.pomodoro_state['tasks'].remove(task)
+                with cols[4]:
+                    if st.button("🗑️", key=f"delete_{task.id}"):
+                        state['tasks'].remove(task.id)
                         st.success("Tarea eliminada!")
                         st.session_state.force_rerun = True
 
+# ==============================================
+# Motor del temporizador (basado en fecha límite)
+# ==============================================
+
+# Margen aceptado cuando el navegador avisa del fin de fase antes que el servidor
+TIMER_SYNC_TOLERANCE = 2.0
+
+# Componente de cuenta regresiva que se anima en el navegador
+_countdown_component = components.declare_component(
+    "pomodoro_countdown",
+    path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "timer_component")
+)
+
+def get_remaining_time(state, now=None):
+    """Calcula el tiempo restante de la fase a partir del reloj y la fecha límite"""
+    if state['timer_running'] and not state['timer_paused'] and state.get('phase_end'):
+        now = time.time() if now is None else now
+        return max(0.0, state['phase_end'] - now)
+    return state['remaining_time']
+
+def get_active_time(state, now=None):
+    """Devuelve el tiempo activo de la fase, incluido el tramo en curso"""
+    active = state['total_active_time']
+    if state['timer_running'] and not state['timer_paused'] and state.get('timer_start'):
+        now = time.time() if now is None else now
+        active += max(0.0, min(now, state['phase_end']) - state['timer_start'])
+    return active
+
+def set_remaining_time(state, seconds):
+    """Fija el tiempo restante de la fase, desplazando la fecha límite si corre"""
+    state['remaining_time'] = seconds
+    if state['timer_running'] and not state['timer_paused'] and state.get('phase_end'):
+        now = time.time()
+        state['total_active_time'] = get_active_time(state, now)
+        state['timer_start'] = now
+        state['phase_end'] = now + seconds
+
+def start_timer(state):
+    """Inicia la fase actual fijando su fecha límite absoluta"""
+    now = time.time()
+    state['timer_running'] = True
+    state['timer_paused'] = False
+    state['start_time'] = datetime.datetime.now()
+    state['total_active_time'] = 0
+    state['timer_start'] = now
+    state['phase_end'] = now + state['remaining_time']
+
+def pause_timer(state):
+    """Pausa el temporizador congelando el tiempo restante y el tiempo activo"""
+    now = time.time()
+    state['remaining_time'] = get_remaining_time(state, now)
+    state['total_active_time'] = get_active_time(state, now)
+    state['timer_paused'] = True
+    state['paused_time'] = now
+    state['timer_start'] = None
+    state['phase_end'] = None
+
+def resume_timer(state):
+    """Reanuda el temporizador recalculando la fecha límite"""
+    now = time.time()
+    state['timer_paused'] = False
+    state['paused_time'] = None
+    state['timer_start'] = now
+    state['phase_end'] = now + state['remaining_time']
+
+def stop_timer(state):
+    """Detiene el temporizador conservando el tiempo activo acumulado"""
+    state['total_active_time'] = get_active_time(state)
+    state['timer_running'] = False
+    state['timer_paused'] = False
+    state['timer_start'] = None
+    state['phase_end'] = None
+    state['paused_time'] = None
+
+def advance_phase(state, auto_start=False):
+    """Cierra la fase actual, registra la sesión y prepara la siguiente.
+
+    Devuelve True si la fase cerrada era de trabajo.
+    """
+    # Cerrar primero el tramo en curso: a partir de aquí el tiempo activo ya no corre
+    stop_timer(state)
+    was_work = state['current_phase'] == "Trabajo"
+
+    if was_work:
+        if state['total_active_time'] >= 0.1:
+            log_session()
+        state['session_count'] += 1
+
+        if state['session_count'] >= state['total_sessions']:
+            st.success("¡Todas las sesiones completadas!")
+            state['session_count'] = 0
+            state['current_phase'] = "Trabajo"
+            state['remaining_time'] = state['work_duration']
+            state['total_active_time'] = 0
+            return was_work
+
+    # Determinar siguiente fase
+    state['current_phase'] = determine_next_phase(was_work)
+    state['remaining_time'] = get_phase_duration(state['current_phase'])
+    state['total_active_time'] = 0
+    if auto_start:
+        start_timer(state)
+    return was_work
+
+def sync_timer(state, tolerance=0.0):
+    """Cierra la fase si su fecha límite ya pasó. Devuelve True si cambió de fase"""
+    if not (state['timer_running'] and not state['timer_paused']):
+        return False
+    if get_remaining_time(state) > tolerance:
+        return False
+
+    was_work = advance_phase(state, auto_start=True)
+    if state['timer_running']:
+        st.success(f"¡Fase completada! Iniciando: {state['current_phase']}")
+
+    # Mostrar notificación toast
+    if was_work:
+        st.toast("¡Pomodoro completado! Tómate un descanso.", icon="🎉")
+    else:
+        st.toast("¡Descanso completado! Volvamos al trabajo.", icon="💪")
+
+    save_to_supabase()  # Guardar estado
+    return True
+
+def reset_timer(state):
+    """Reinicia el ciclo completo, guardando la sesión de trabajo en curso"""
+    was_running = state['timer_running']
+    stop_timer(state)
+    if was_running and state['current_phase'] == "Trabajo" and state['total_active_time'] >= 0.1:
+        log_session()  # Guarda la sesión incompleta
+
+    state['session_count'] = 0
+    state['current_phase'] = "Trabajo"
+    state['remaining_time'] = state['work_duration']
+    state['total_active_time'] = 0
+    state['start_time'] = None
+    st.success("Temporizador reiniciado")
+
+def countdown_timer(state, key="countdown"):
+    """Muestra la cuenta regresiva del navegador y devuelve el evento pulsado.
+
+    El servidor sólo envía el tiempo restante al cambiar de fase, pausar o
+    reanudar; mientras la fase corre el navegador anima el contador solo.
+    """
+    theme = THEMES[state['current_theme']]
+    ticking = state['timer_running'] and not state['timer_paused']
+    remaining = get_remaining_time(state)
+
+    # El token sólo cambia cuando hay una cuenta nueva que reiniciar en el navegador
+    token = f"{state['current_phase']}|{state['phase_end'] if ticking else remaining}|{ticking}"
+
+    event = _countdown_component(
+        phase=state['current_phase'],
+        remaining=remaining,
+        duration=get_phase_duration(state['current_phase']),
+        color=get_phase_color(state['current_phase']),
+        ticking=ticking,
+        running=state['timer_running'],
+        token=token,
+        bg=theme['bg'],
+        text=theme['text'],
+        ring_bg=theme['circle_bg'],
+        key=key,
+        default=None
+    )
+
+    # El valor del componente persiste entre reruns: procesar cada evento una vez
+    if not event or event.get('seq') == st.session_state.get('timer_event_seq'):
+        return None
+    st.session_state.timer_event_seq = event['seq']
+    return event['event']
+
+def handle_timer_event(state, event):
+    """Aplica en el servidor un evento enviado por el componente de cuenta regresiva"""
+    if event == "start" and not state['timer_running']:
+        start_timer(state)
+    elif event == "pause" and state['timer_running'] and not state['timer_paused']:
+        pause_timer(state)
+    elif event == "resume" and state['timer_paused']:
+        resume_timer(state)
+    elif event == "skip":
+        advance_phase(state)
+    elif event == "reset":
+        reset_timer(state)
+    elif event == "phase_complete":
+        # sync_timer guarda por su cuenta; los avisos prematuros se ignoran
+        if sync_timer(state, tolerance=TIMER_SYNC_TOLERANCE):
+            st.session_state.force_rerun = True
+        return
+    else:
+        return
+
+    save_to_supabase()  # Guardar estado
+    st.session_state.force_rerun = True
+
 # ==============================================
 # Pestaña de Temporizador (Mejorada)
 # ==============================================
@@ -931,14 +2528,6 @@ def timer_tab():
     """Muestra la pestaña del temporizador Pomodoro"""
     state = st.session_state.pomodoro_state
     
-    # Inicializar variables de control del temporizador si no existen
-    if 'timer_start' not in st.session_state:
-        st.session_state.timer_start = None
-    if 'last_update' not in st.session_state:
-        st.session_state.last_update = None
-    if 'paused_time' not in st.session_state:
-        st.session_state.paused_time = None
-    
     # Mostrar materia actual si está en modo estudio
     if state['study_mode'] and state['current_activity']:
         st.header(f"Actividad: {state['current_activity']}")
@@ -969,19 +2558,19 @@ def timer_tab():
     with st.expander("➕ Crear Proyecto Rápido", expanded=False):
         new_project_name = st.text_input("Nombre del proyecto", key="new_project_timer")
         if st.button("Crear Proyecto", key="create_project_timer"):
-            if new_project_name and new_project_name not in [p['name'] for p in state['projects']]:
-                state['projects'].append({
-                    'name': new_project_name,
-                    'activity': state['current_activity']
-                })
+            if new_project_name and new_project_name not in [p.name for p in state['projects']]:
+                state['projects'].append(Project(
+                    name=new_project_name,
+                    activity=state['current_activity']
+                ))
                 st.success("Proyecto creado!")
                 save_to_supabase()  # Guardar después de crear proyecto
                 st.session_state.force_rerun = True
-            elif new_project_name in [p['name'] for p in state['projects']]:
+            elif new_project_name in [p.name for p in state['projects']]:
                 st.error("Ya existe un proyecto con ese nombre")
 
     # Selector de proyecto (solo proyectos asociados a la actividad actual) con clave única
-    available_projects = [p['name'] for p in state['projects'] if p['activity'] == state['current_activity']]
+    available_projects = [p.name for p in state['projects'] if p.activity == state['current_activity']]
     if available_projects:
         # Si el proyecto actual no está en la lista de disponibles, resetear a "Ninguno" o al primero
         if state['current_project'] not in available_projects:
@@ -1007,29 +2596,38 @@ def timer_tab():
     # Si hay un proyecto seleccionado, mostrar selector de tareas asociadas
     if state['current_project'] != "Ninguno":
         # Obtener tareas no completadas para este proyecto y actividad
-        project_tasks = [t for t in state['tasks'] 
-                       if not t['completed'] 
-                       and t['project'] == state['current_project'] 
-                       and t.get('activity') == state['current_activity']]
+        project_tasks = state['tasks'].pending_in(state['current_activity'], state['current_project'])
         
         if project_tasks:
-            # Crear selector de tareas existentes
-            task_names = [t['name'] for t in project_tasks]
+            # Crear selector de tareas existentes (por id: puede haber nombres repetidos)
+            task_ids = [t.id for t in project_tasks]
             # Asegurar que la tarea actual esté en la lista
-            if 'current_task' not in state or state['current_task'] not in task_names:
-                state['current_task'] = task_names[0] if task_names else ""
-
-            options = ["-- Seleccionar --"] + task_names + ["+ Crear nueva tarea"]
+            if state.get('current_task_id') not in task_ids:
+                # Los estados anteriores sólo guardaban el nombre de la tarea
+                state['current_task_id'] = next(
+                    (t.id for t in project_tasks if t.name == state.get('current_task')), task_ids[0])
+            state['current_task'] = state['tasks'].get(state['current_task_id']).name
+
+            names = [t.name for t in project_tasks]
+            def task_label(option):
+                """Nombre de la tarea; si se repite, con la fecha límite y el id para distinguirla"""
+                task = state['tasks'].get(option) if option in task_ids else None
+                if task is None:
+                    return option
+                if names.count(task.name) == 1:
+                    return task.name
+                deadline = f" · {task.deadline.strftime('%d/%m')}" if task.deadline else ""
+                return f"{task.name}{deadline} · #{task.id[:6]}"
+
+            options = ["-- Seleccionar --"] + task_ids + ["+ Crear nueva tarea"]
             # Encontrar el índice de la tarea actual
-            try:
-                index = task_names.index(state['current_task']) + 1
-            except ValueError:
-                index = 0
+            index = task_ids.index(state['current_task_id']) + 1
 
             selected_task = st.selectbox(
                 "Seleccionar tarea existente", 
                 options,
                 index=index,
+                format_func=task_label,
                 key="timer_task_selector"
             )
             
@@ -1038,37 +2636,40 @@ def timer_tab():
                 new_task_name = st.text_input("Nombre de la nueva tarea", key="new_task_name")
                 if new_task_name:
                     # Crear la tarea automáticamente al seleccionarla
-                    new_task = {
-                        'name': new_task_name,
-                        'project': state['current_project'],
-                        'activity': state['current_activity'],
-                        'priority': "Media",
-                        'deadline': date.today() + timedelta(days=7),
-                        'completed': False,
-                        'created': date.today()
-                    }
-                    state['tasks'].append(new_task)
+                    new_task = Task(
+                        name=new_task_name,
+                        project=state['current_project'],
+                        activity=state['current_activity'],
+                        priority="Media",
+                        deadline=date.today() + timedelta(days=7),
+                        completed=False,
+                        created=date.today()
+                    )
+                    state['tasks'].add(new_task)
                     state['current_task'] = new_task_name
+                    state['current_task_id'] = new_task.id
                     st.success("Tarea creada!")
                     save_to_supabase()  # Guardar después de crear tarea
                     st.session_state.force_rerun = True
             elif selected_task != "-- Seleccionar --":
-                state['current_task'] = selected_task
+                state['current_task_id'] = selected_task
+                state['current_task'] = state['tasks'].get(selected_task).name
         else:
             # No hay tareas para este proyecto, permitir crear una
             new_task_name = st.text_input("Nombre de la tarea", key="new_task_name_no_existing")
             if new_task_name:
-                new_task = {
-                    'name': new_task_name,
-                    'project': state['current_project'],
-                    'activity': state['current_activity'],
-                    'priority': "Media",
-                    'deadline': date.today() + timedelta(days=7),
-                    'completed': False,
-                    'created': date.today()
-                }
-                state['tasks'].append(new_task)
+                new_task = Task(
+                    name=new_task_name,
+                    project=state['current_project'],
+                    activity=state['current_activity'],
+                    priority="Media",
+                    deadline=date.today() + timedelta(days=7),
+                    completed=False,
+                    created=date.today()
+                )
+                state['tasks'].add(new_task)
                 state['current_task'] = new_task_name
+                state['current_task_id'] = new_task.id
                 st.success("Tarea creada!")
                 save_to_supabase()  # Guardar después de crear tarea
                 st.session_state.force_rerun = True
@@ -1078,203 +2679,18 @@ def timer_tab():
         st.error("Selecciona una actividad para comenzar")
         return
 
-    # Visualización del temporizador
-    theme = THEMES[state['current_theme']]
-
-    # Crear un círculo de progreso con Plotly
-    phase_duration = get_phase_duration(state['current_phase'])
-    progress = 1 - (state['remaining_time'] / phase_duration) if phase_duration > 0 else 0
-
-    fig = go.Figure(go.Indicator(
-        mode = "gauge+number",
-        value = state['remaining_time'],
-        number = {'suffix': "s", 'font': {'size': 40}},
-        gauge = {
-            'axis': {'range': [0, phase_duration], 'visible': False},
-            'bar': {'color': get_phase_color(state['current_phase'])},
-            'steps': [
-                {'range': [0, phase_duration], 'color': theme['circle_bg']}
-            ]
-        },
-        domain = {'x': [0, 1], 'y': [0, 1]},
-        title = {'text': f"{state['current_phase']} - {format_time(state['remaining_time'])}", 'font': {'size': 24}}
-    ))
-
-    fig.update_layout(
-        height=300,
-        margin=dict(l=10, r=10, t=80, b=10),
-        paper_bgcolor=theme['bg'],
-        font={'color': theme['text']}
-    )
-
-    # Usar un contenedor para el gráfico que no force rerenderizados completos
-    chart_placeholder = st.empty()
-    chart_placeholder.plotly_chart(fig, use_container_width=True)
-
-    # Controles del temporizador - ahora con 4 columnas para incluir el botón de reinicio
-    col1, col2, col3, col4 = st.columns(4)
-
-    with col1:
-        if st.button("▶️ Iniciar" if not state['timer_running'] else "▶️ Reanudar",
-                   use_container_width=True, type="primary", key="start_timer"):
-            if not state['timer_running']:
-                state['timer_running'] = True
-                state['timer_paused'] = False
-                state['start_time'] = datetime.datetime.now()
-                state['total_active_time'] = 0
-                # Iniciar el temporizador
-                st.session_state.timer_start = time.time()
-                st.session_state.last_update = time.time()
-                save_to_supabase()  # Guardar estado
-                st.session_state.force_rerun = True
-
-    with col2:
-        if st.button("⏸️ Pausar" if state['timer_running'] and not state['timer_paused'] else "▶️ Reanudar",
-                   use_container_width=True, disabled=not state['timer_running'], key="pause_timer"):
-            if state['timer_running'] and not state['timer_paused']:
-                state['timer_paused'] = True
-                state['paused_time'] = time.time()
-                st.session_state.paused_time = time.time()
-                save_to_supabase()  # Guardar estado
-                st.session_state.force_rerun = True
-            elif state['timer_paused']:
-                state['timer_paused'] = False
-                # Ajustar el tiempo de inicio para compensar la pausa
-                pause_duration = time.time() - st.session_state.paused_time
-                st.session_state.timer_start += pause_duration
-                st.session_state.last_update = time.time()
-                save_to_supabase()  # Guardar estado
-                st.session_state.force_rerun = True
-
-    with col3:
-        if st.button("⏭️ Saltar Fase", use_container_width=True, key="skip_phase"):
-            was_work = state['current_phase'] == "Trabajo"
-
-            # Lógica para sesiones de trabajo
-            if was_work:
-                state['session_count'] += 1
-                if state['total_active_time'] >= 0.1:
-                    log_session()  # Esta función ahora guarda automáticamente
-                
-                if state['session_count'] >= state['total_sessions']:
-                    st.success("¡Todas las sesiones completadas!")
-                    state['session_count'] = 0
-                    state['current_phase'] = "Trabajo"
-                    state['remaining_time'] = state['work_duration']
-                    state['timer_running'] = False
-                    state['timer_paused'] = False
-                    save_to_supabase()  # Guardar estado
-                    st.session_state.force_rerun = True
-            
-            # Determinar siguiente fase
-            state['current_phase'] = determine_next_phase(was_work)
-            state['remaining_time'] = get_phase_duration(state['current_phase'])
-            state['total_active_time'] = 0
-            state['timer_running'] = False
-            state['timer_paused'] = False
-            save_to_supabase()  # Guardar estado
-            st.session_state.force_rerun = True
+    # Cerrar la fase si su fecha límite ya pasó (también tras recargar la página)
+    sync_timer(state)
 
-    with col4:
-        if st.button("🔄 Reiniciar", use_container_width=True, key="reset_timer"):
-            # Función de reinicio del temporizador
-            # Si el temporizador está en ejecución y es fase de trabajo, guardar el tiempo transcurrido
-            if state['timer_running'] and state['current_phase'] == "Trabajo" and state['total_active_time'] >= 0.1:
-                log_session()  # Guarda la sesión incompleta
-            
-            # Si el temporizador está en pausa, no guardar duplicados
-            state['timer_running'] = False
-            state['timer_paused'] = False
-            state['session_count'] = 0
-            state['current_phase'] = "Trabajo"
-            state['remaining_time'] = state['work_duration']
-            state['total_active_time'] = 0
-            state['start_time'] = None
-            state['paused_time'] = None
-            st.session_state.timer_start = None
-            st.session_state.last_update = None
-            st.session_state.paused_time = None
-            st.success("Temporizador reiniciado")
-            save_to_supabase()  # Guardar estado
-            st.session_state.force_rerun = True
+    # Visualización del temporizador: el navegador anima la cuenta regresiva y
+    # sólo avisa al servidor al pulsar un control o al terminar la fase
+    event = countdown_timer(state)
+    if event:
+        handle_timer_event(state, event)
 
     # Contador de sesiones
     st.write(f"Sesiones completadas: {state['session_count']}/{state['total_sessions']}")
 
-    # Actualizar el temporizador si está en ejecución
-    if state['timer_running'] and not state['timer_paused']:
-        current_time = time.time()
-        
-        # Solo actualizar si ha pasado al menos 1 segundo
-        if current_time - st.session_state.last_update >= 1.0:
-            elapsed = current_time - st.session_state.last_update
-            st.session_state.last_update = current_time
-
-            state['remaining_time'] -= elapsed
-            state['total_active_time'] += elapsed
-
-            if state['remaining_time'] <= 0:
-                # Fase completada
-                was_work = state['current_phase'] == "Trabajo"
-                
-                if was_work:
-                    if state['total_active_time'] >= 0.1:
-                        log_session()  # Esta función ahora guarda automáticamente
-                    state['session_count'] += 1
-                    
-                    if state['session_count'] >= state['total_sessions']:
-                        st.success("¡Todas las sesiones completadas!")
-                        state['session_count'] = 0
-                        state['current_phase'] = "Trabajo"
-                        state['remaining_time'] = state['work_duration']
-                        state['timer_running'] = False
-                        state['timer_paused'] = False
-                        save_to_supabase()  # Guardar estado
-                        st.session_state.force_rerun = True
-                
-                # Determinar siguiente fase
-                state['current_phase'] = determine_next_phase(was_work)
-                state['remaining_time'] = get_phase_duration(state['current_phase'])
-                state['total_active_time'] = 0
-                st.success(f"¡Fase completada! Iniciando: {state['current_phase']}")
-                
-                # Mostrar notificación toast
-                if was_work:
-                    st.toast("¡Pomodoro completado! Tómate un descanso.", icon="🎉")
-                else:
-                    st.toast("¡Descanso completado! Volvamos al trabajo.", icon="💪")
-                
-                save_to_supabase()  # Guardar estado
-                st.session_state.force_rerun = True
-            else:
-                # Solo actualizar el gráfico sin forzar un rerun completo
-                fig = go.Figure(go.Indicator(
-                    mode = "gauge+number",
-                    value = state['remaining_time'],
-                    number = {'suffix': "s", 'font': {'size': 40}},
-                    gauge = {
-                        'axis': {'range': [0, phase_duration], 'visible': False},
-                        'bar': {'color': get_phase_color(state['current_phase'])},
-                        'steps': [
-                            {'range': [0, phase_duration], 'color': theme['circle_bg']}
-                        ]
-                    },
-                    domain = {'x': [0, 1], 'y': [0, 1]},
-                    title = {'text': f"{state['current_phase']} - {format_time(state['remaining_time'])}", 'font': {'size': 24}}
-                ))
-
-                fig.update_layout(
-                    height=300,
-                    margin=dict(l=10, r=10, t=80, b=10),
-                    paper_bgcolor=theme['bg'],
-                    font={'color': theme['text']}
-                )
-                
-                chart_placeholder.plotly_chart(fig, use_container_width=True)
-
-    # Forzar actualización de la interfaz si es necesario
-    time.sleep(0.1)
-    st.rerun()
 # ==============================================
 # Pestaña de Estadísticas (Mejorada)
 # ==============================================
@@ -1283,35 +2699,23 @@ def stats_tab():
     """Muestra la pestaña de estadísticas"""
     st.title("📊 Estadísticas Avanzadas")
     
-    if not st.session_state.pomodoro_state['session_history']:
+    state = st.session_state.pomodoro_state
+    if not state['session_history'] and not state.get('history_skipped'):
         st.warning("No hay datos de sesiones registrados.")
         return
     
-    data = analyze_data()
-    
-    # Mostrar información de depuración
-    if data['errors']:
-        with st.expander("⚠️ Errores de procesamiento (click para ver)"):
-            for error in data['errors']:
-                st.error(error)
-    
-    # Mostrar resumen de depuración
-    with st.expander("🔍 Información de depuración"):
-        st.write(f"Total de entradas en historial: {len(st.session_state.pomodoro_state['session_history'])}")
-        st.write(f"Total de entradas procesadas: {len(data['raw_data'])}")
-        st.write(f"Total de errores: {len(data['errors'])}")
-        st.write("Historial completo:")
-        st.write(st.session_state.pomodoro_state['session_history'])
+    # Métricas y gráficos salen de los totales incrementales: O(categorías)
+    rollups = ensure_rollups(state)
     
     # Mostrar métricas principales
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        total_hours = sum(data['activities'].values())
+        total_hours = rollups['total_hours']
         st.metric("Tiempo Total", f"{total_hours:.2f} horas")
     
     with col2:
-        total_sessions = len(data['raw_data'])
+        total_sessions = rollups['sessions']
         st.metric("Sesiones Totales", total_sessions)
     
     with col3:
@@ -1319,15 +2723,7 @@ def stats_tab():
         st.metric("Duración Promedio", f"{avg_session:.1f} min")
     
     with col4:
-        # Para daily_total, necesitamos manejar tanto strings como objetos date
-        unique_dates = set()
-        for date_key in data['daily_total'].keys():
-            if isinstance(date_key, str):
-                unique_dates.add(date_key)
-            elif isinstance(date_key, (datetime.date, datetime.datetime)):
-                unique_dates.add(date_key.strftime("%Y-%m-%d"))
-        unique_days = len(unique_dates)
-        st.metric("Días Activos", unique_days)
+        st.metric("Días Activos", len(rollups['days']))
         
     # Selector de pestañas
     tab1, tab2, tab3, tab4 = st.tabs(["Visión General", "Tendencias", "Distribución", "Tabla Resumen"])
@@ -1337,9 +2733,9 @@ def stats_tab():
         
         with col1:
             # Gráfico de distribución de actividades
-            if data['activities']:
+            if rollups['activities']:
                 # Filtrar actividades con tiempo significativo
-                filtered_activities = {k: v for k, v in data['activities'].items() if v > 0.1}
+                filtered_activities = {k: v for k, v in rollups['activities'].items() if v > 0.1}
                 
                 if filtered_activities:
                     fig = px.pie(
@@ -1355,7 +2751,7 @@ def stats_tab():
         
         with col2:
             # Gráfico de tiempo por proyecto
-            project_data = {k: v for k, v in data['projects'].items() if v > 0.1}
+            project_data = {k: v for k, v in rollups['projects'].items() if v > 0.1}
             
             if project_data:
                 fig = px.pie(
@@ -1371,13 +2767,11 @@ def stats_tab():
         st.subheader("Análisis de Tendencias")
         
         # Gráfico de líneas - evolución del tiempo
-        if data['raw_data']:
-            # Agrupar por fecha
-            df_dates = pd.DataFrame([
-                {'date': r['date'], 'hours': r['duration']} 
-                for r in data['raw_data']
-            ])
-            daily_totals = df_dates.groupby('date').sum().reset_index()
+        if rollups['days']:
+            daily_totals = pd.DataFrame({
+                'date': pd.to_datetime(list(rollups['days'].keys())),
+                'hours': [day['hours'] for day in rollups['days'].values()]
+            }).sort_values('date')
             
             fig = px.line(
                 daily_totals, x='date', y='hours',
@@ -1385,58 +2779,72 @@ def stats_tab():
                 labels={'date': 'Fecha', 'hours': 'Horas'}
             )
             st.plotly_chart(fig, use_container_width=True)
+            
+            # Distribución por hora del día
+            by_hour = pd.DataFrame({
+                'hour': [int(hour) for hour in rollups['hours']],
+                'hours': list(rollups['hours'].values())
+            }).sort_values('hour')
+            fig = px.bar(
+                by_hour, x='hour', y='hours',
+                title="Tiempo por Hora del Día",
+                labels={'hour': 'Hora', 'hours': 'Horas'}
+            )
+            st.plotly_chart(fig, use_container_width=True)
         else:
             st.info("No hay datos suficientes para mostrar tendencias")
     
     with tab3:
         st.subheader("Distribución por Actividad y Proyecto")
         
-        if data['raw_data']:
-            # Crear matriz para heatmap
-            activities = sorted(set(r['activity'] for r in data['raw_data'] if r['activity']))
-            projects = sorted(set(r['project'] for r in data['raw_data'] if r['project']))
-            
-            # Crear matriz de horas por actividad y proyecto
-            heatmap_data = np.zeros((len(activities), len(projects)))
-            
-            for r in data['raw_data']:
-                if r['project'] and r['activity']:
-                    try:
-                        act_idx = activities.index(r['activity'])
-                        proj_idx = projects.index(r['project'])
-                        heatmap_data[act_idx, proj_idx] += r['duration']
-                    except (ValueError, IndexError):
-                        # Ignorar entradas que no estén en las listas
-                        pass
+        # Matriz de horas por actividad y proyecto
+        if rollups['activity_projects']:
+            heatmap_data = pd.DataFrame(rollups['activity_projects']).T.fillna(0) \
+                .sort_index().sort_index(axis=1)
             
-            # Crear heatmap solo si hay datos
-            if np.sum(heatmap_data) > 0:
-                fig = px.imshow(
-                    heatmap_data,
-                    labels=dict(x="Proyecto", y="Actividad", color="Horas"),
-                    x=projects,
-                    y=activities,
-                    title="Distribución de Tiempo por Actividad y Proyecto"
-                )
-                st.plotly_chart(fig, use_container_width=True)
-            else:
-                st.info("No hay datos suficientes para el heatmap")
+            fig = px.imshow(
+                heatmap_data.to_numpy(),
+                labels=dict(x="Proyecto", y="Actividad", color="Horas"),
+                x=list(heatmap_data.columns),
+                y=list(heatmap_data.index),
+                title="Distribución de Tiempo por Actividad y Proyecto"
+            )
+            st.plotly_chart(fig, use_container_width=True)
         else:
             st.info("No hay datos suficientes para el heatmap")
     
     with tab4:
         st.subheader("Tabla Resumen de Sesiones")
         
-        if data['raw_data']:
+        # Al iniciar sesión sólo se cargan las sesiones recientes; el resto, a petición
+        if state.get('history_skipped'):
+            st.caption(f"Se muestran las sesiones de los últimos {HISTORY_RECENT_DAYS} días "
+                       f"({state['history_skipped']} sesiones anteriores sin cargar)")
+            if st.button("Cargar historial completo", key="load_full_history"):
+                load_full_history(state)
+        
+        # La tabla necesita el detalle por sesión (cacheado por versión del historial)
+        data = analyze_data(st.session_state.username, state['history_version'], state['session_history'])
+        frame = data['frame']
+        
+        # Mostrar resumen de depuración (el historial completo sólo con POMODORO_LOG_LEVEL=DEBUG)
+        with st.expander("🔍 Información de depuración"):
+            st.write(f"Total de entradas en historial: {len(state['session_history'])}")
+            st.write(f"Total de entradas procesadas: {len(frame)}")
+            if logger.isEnabledFor(logging.DEBUG):
+                st.write("Historial completo:")
+                st.write(state['session_history'])
+        
+        if not frame.empty:
             # Crear DataFrame para mostrar
-            df_display = pd.DataFrame([{
-                'Fecha': r['date'].strftime("%Y-%m-%d"),
-                'Hora': f"{r['hour']:02d}:00",
-                'Duración (horas)': round(r['duration'], 2),
-                'Actividad': r['activity'],
-                'Proyecto': r['project'],
-                'Tarea': r['task']
-            } for r in data['raw_data']])
+            df_display = pd.DataFrame({
+                'Fecha': frame['date'].dt.strftime("%Y-%m-%d"),
+                'Hora': frame['hour'].astype(str).str.zfill(2) + ":00",
+                'Duración (horas)': frame['duration'].round(2),
+                'Actividad': frame['activity'],
+                'Proyecto': frame['project'],
+                'Tarea': frame['task']
+            })
             
             st.dataframe(df_display, use_container_width=True)
             
@@ -1449,6 +2857,16 @@ def stats_tab():
                     file_name="sesiones_pomodoro.csv",
                     mime="text/csv"
                 )
+            
+            # Export columnar para análisis externo (sólo se genera al pulsar)
+            st.download_button(
+                label="Descargar Parquet",
+                data=lambda: build_sessions_parquet(frame),
+                file_name="sesiones_pomodoro.parquet",
+                mime="application/vnd.apache.parquet",
+                help="Tabla de sesiones tipada, lista para pandas, Polars o DuckDB",
+                key="download_parquet"
+            )
         else:
             st.info("No hay sesiones registradas")
 
@@ -1494,9 +2912,9 @@ def tasks_tab():
         if 'filter_project' not in state:
             state['filter_project'] = "Todos"
             
-        available_projects = ["Todos"] + [p['name'] for p in state['projects']]
+        available_projects = ["Todos"] + [p.name for p in state['projects']]
         if filter_activity != "Todas":
-            available_projects = ["Todos"] + [p['name'] for p in state['projects'] if p['activity'] == filter_activity]
+            available_projects = ["Todos"] + [p.name for p in state['projects'] if p.activity == filter_activity]
         
         # Encontrar el índice del proyecto actual en el filtro
         try:
@@ -1549,7 +2967,7 @@ def show_achievements():
         st.metric("Tareas Completadas", achievements['tasks_completed'])
     
     with col3:
-        st.metric("Días de Racha", achievements['streak_days'])
+        st.metric("Días de Racha", current_streak(ensure_rollups(state)))
     
     with col4:
         st.metric("Horas Totales", f"{achievements['total_hours']:.1f}")
@@ -1584,11 +3002,11 @@ def settings_tab():
         if st.button("Aplicar Configuración", key="apply_settings"):
             # Actualizar el tiempo restante si estamos en la fase correspondiente
             if state['current_phase'] == "Trabajo":
-                state['remaining_time'] = work_min * 60
+                set_remaining_time(state, work_min * 60)
             elif state['current_phase'] == "Descanso Corto":
-                state['remaining_time'] = short_min * 60
+                set_remaining_time(state, short_min * 60)
             elif state['current_phase'] == "Descanso Largo":
-                state['remaining_time'] = long_min * 60
+                set_remaining_time(state, long_min * 60)
                 
             state['work_duration'] = work_min * 60
             state['short_break'] = short_min * 60
@@ -1635,20 +3053,28 @@ def settings_tab():
 
     with col2:
         st.write("Importar Datos")
-        uploaded_file = st.file_uploader("Subir archivo de backup", 
-                                       type=['json.gz'], 
-                                       key="upload_backup")
-        if uploaded_file is not None:
-            import_data(uploaded_file)
+        uploaded_files = st.file_uploader("Subir archivo de backup", 
+                                        type=['json.gz', 'ndjson.gz'], 
+                                        accept_multiple_files=True,
+                                        help="Un backup completo y, si los hay, sus incrementales",
+                                        key="upload_backup")
+        if uploaded_files:
+            import_data(uploaded_files)
 
     st.subheader("🛠️ Herramientas Avanzadas")
     if st.button("🔄 Reiniciar Datos", key="reset_data"):
         state['activities'] = []
-        state['tasks'] = []
-        state['completed_tasks'] = []
+        state['tasks'] = TaskStore()
         state['study_goals'] = []
         state['projects'] = []
         state['session_history'] = []
+        state['history_skipped'] = 0
+        bump_history_version(state)
+        state['rollups'] = empty_rollups()
+        sync_streak(state)
+        state['backup_watermark'] = None  # El próximo backup tiene que ser completo
+        st.session_state.pop('last_import_upload', None)  # Permite volver a importar la misma subida
+        init_session_store().clear(st.session_state.username)
         st.success("Datos reiniciados (excepto configuración)")
         st.session_state.force_rerun = True
 
@@ -1740,47 +3166,36 @@ def info_tab():
 # Barra lateral (Mejorada)
 # ==============================================
 def check_alerts():
-    """Verifica alertas y notificaciones para el usuario"""
+    """Verifica alertas y notificaciones para el usuario.
+
+    Las alertas se memorizan hasta que cambian las tareas, el historial o el
+    día, así que los reruns del temporizador no las recalculan.
+    """
     state = st.session_state.pomodoro_state
-    alerts = []
-    
-    # Verificar tareas próximas a vencer
     today = date.today()
-    for task in state['tasks']:
-        # Manejar tanto string como objeto date en el deadline
-        if isinstance(task['deadline'], str):
-            try:
-                deadline = datetime.datetime.strptime(task['deadline'], "%Y-%m-%d").date()
-            except (ValueError, TypeError):
-                continue
-        else:
-            deadline = task['deadline']
-        
-        days_until_due = (deadline - today).days
-        if 0 <= days_until_due <= 2:
-            alerts.append(f"📅 Tarea '{task['name']}' vence en {days_until_due} días")
+    cache_key = (id(state['tasks']), state['tasks'].version, state['history_version'], today)
+    cached = st.session_state.get('alerts_cache')
+    if cached and cached[0] == cache_key:
+        return cached[1]
     
-    # Verificar si hay sesiones de estudio hoy
-    today_str = today.strftime("%Y-%m-%d")
-    sessions_today = 0
-    for session in state['session_history']:
-        # Manejar diferentes formatos de fecha en el historial
-        session_date = session['Fecha']
-        if isinstance(session_date, str):
-            if session_date == today_str:
-                sessions_today += 1
-        elif isinstance(session_date, (datetime.date, datetime.datetime)):
-            session_date_str = session_date.strftime("%Y-%m-%d") if isinstance(session_date, datetime.date) else session_date.date().strftime("%Y-%m-%d")
-            if session_date_str == today_str:
-                sessions_today += 1
+    alerts = []
+    
+    # Verificar tareas próximas a vencer (montículo de fechas límite)
+    for task in state['tasks'].due_between(today, today + timedelta(days=2)):
+        days_until_due = (TaskStore.due_date(task) - today).days
+        alerts.append(f"📅 Tarea '{task.name}' vence en {days_until_due} días")
     
-    if sessions_today == 0:
+    # Verificar si hay sesiones de estudio hoy (contador por día de los rollups)
+    rollups = ensure_rollups(state)
+    if sessions_on(rollups, today) == 0:
         alerts.append("ℹ️ Aún no has tenido sesiones de estudio hoy")
     
     # Verificar racha de estudio
-    if state['achievements']['streak_days'] > 0:
-        alerts.append(f"🔥 ¡Llevas una racha de {state['achievements']['streak_days']} días!")
+    streak = current_streak(rollups, today)
+    if streak > 0:
+        alerts.append(f"🔥 ¡Llevas una racha de {streak} días!")
     
+    st.session_state.alerts_cache = (cache_key, alerts)
     return alerts
     
 def sidebar():
@@ -1823,12 +3238,28 @@ def sidebar():
             col1, col2 = st.columns(2)
             with col1:
                 if st.button("💾 Guardar", key="save_cloud"):
-                    save_to_supabase()
+                    save_to_supabase(immediate=True)
             
             with col2:
                 if st.button("📂 Cargar", key="load_cloud"):
                     if load_from_supabase():
                         st.session_state.force_rerun = True
+            
+            # Tamaño del último guardado frente al estado completo
+            stats = st.session_state.get('save_stats')
+            if stats and stats['saves']:
+                st.caption(
+                    f"Último guardado: {stats['last_bytes'] / 1024:.1f} KB de "
+                    f"{stats['last_full_bytes'] / 1024:.1f} KB "
+                    f"({', '.join(stats['last_keys']) or 'sin cambios'})"
+                )
+            
+            # Guardados pedidos frente a escrituras reales en Supabase
+            queue = st.session_state.get('save_queue')
+            if queue is not None:
+                st.caption(f"Guardados pedidos: {queue.requested} | enviados: {queue.sent}")
+                if queue.last_error:
+                    st.error(f"Error al guardar: {queue.last_error}")
         
         # Cerrar sesión
         st.divider()
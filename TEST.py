@@ -592,27 +592,41 @@ def analyze_data():
     
     return data
 
+# Sonido de alarma: se lee una sola vez por proceso
+ALARM_SOUND_FILE = "mixkit-bell-notification-933.wav"
+# Tiempo durante el que se mantiene montado el reproductor (el sonido dura ~3,4 s)
+ALARM_PLAY_SECONDS = 5.0
+
+@st.cache_resource
+def load_alarm_sound():
+    """Lee el archivo de audio de la alarma (cacheado para todo el proceso)"""
+    with open(ALARM_SOUND_FILE, "rb") as audio_file:
+        return audio_file.read()
+
+def request_alarm_sound():
+    """Pide que la alarma suene durante los próximos reruns"""
+    st.session_state.alarm_until = time.time() + ALARM_PLAY_SECONDS
+
 def play_alarm_sound():
-    """Reproduce un sonido de alarma usando el archivo local"""
+    """Mantiene el reproductor oculto de la alarma mientras dura el sonido.
+
+    Se llama en el mismo punto de cada rerun: el elemento conserva su posición
+    y su URL, así que el navegador no lo desmonta antes de descargar y
+    reproducir el archivo aunque la página se vuelva a ejecutar enseguida.
+    """
+    if time.time() >= st.session_state.get('alarm_until', 0):
+        return
     try:
-        # Leer el archivo de audio local
-        audio_file = open("mixkit-bell-notification-933.wav", "rb")
-        audio_bytes = audio_file.read()
-        audio_file.close()
-        
-        # Codificar en base64 para incrustarlo en HTML
-        audio_base64 = base64.b64encode(audio_bytes).decode()
-        
-        # Crear el elemento de audio HTML
-        sound_html = f"""
-        <audio autoplay>
-            <source src="data:audio/wav;base64,{audio_base64}" type="audio/wav">
-        </audio>
-        """
-        st.components.v1.html(sound_html, height=0)
+        # st.audio sirve los bytes como archivo multimedia por URL, en lugar de
+        # incrustar ~800 KB de base64 en el HTML en cada fin de fase
+        st.html("<style>.st-key-alarm_sound { display: none; }</style>")
+        with st.container(key="alarm_sound"):
+            st.audio(load_alarm_sound(), format="audio/wav", autoplay=True)
     except FileNotFoundError:
+        st.session_state.alarm_until = 0
         st.error("Archivo de sonido no encontrado. Asegúrate de que 'mixkit-bell-notification-933.wav' esté en el directorio principal.")
     except Exception as e:
+        st.session_state.alarm_until = 0
         st.error(f"Error al reproducir el sonido: {str(e)}")
     
 def on_close():
@@ -1419,8 +1433,8 @@ def timer_tab():
                 state['timer_running'] = False  # Detener el temporizador
                 state['timer_paused'] = False
                 
-                # Reproducir sonido de alarma
-                play_alarm_sound()
+                # Reproducir sonido de alarma (desde los reruns siguientes)
+                request_alarm_sound()
                 
                 st.success(f"¡Fase completada! Presiona 'Iniciar' para comenzar {state['current_phase']}")
                 save_to_supabase()  # Guardar estado
@@ -2094,6 +2108,9 @@ def main():
         st.warning("Por favor inicia sesión o regístrate para acceder a Pomodoro Pro")
         return
 
+    # Alarma de fin de fase: siempre en la misma posición para que sobreviva a los reruns
+    play_alarm_sound()
+
     # Obtener la pestaña seleccionada
     if 'sidebar_nav' not in st.session_state:
         st.session_state.sidebar_nav = "📊 Dashboard"  # Cambiado a Dashboard por defecto
@@ -0,0 +1,110 @@
+"""Benchmark del análisis de estadísticas sobre 100.000 sesiones (user-008).
+
+Compara el bucle original de analyze_data(), reproducido abajo con sus
+print() por entrada redirigidos a un búfer y los DataFrames que stats_tab()
+reconstruía para cada gráfico, con el DataFrame tipado actual
+(build_sessions_frame + groupbys) y las mismas entradas de los gráficos.
+La conversión del historial a SessionRecord (decode_sessions, que ahora se
+hace una vez al cargar) se mide aparte.
+
+    python bench/bench_analytics.py
+"""
+import contextlib
+import datetime
+import io
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from common import legacy_sessions, load_app, timed
+
+SESSIONS = 100_000
+
+def legacy_analyze(history):
+    """analyze_data() original: un bucle por entrada con strptime y print()"""
+    data = {'activities': defaultdict(float), 'projects': defaultdict(float),
+            'tasks': defaultdict(float), 'daily_total': defaultdict(float), 'raw_data': [], 'errors': []}
+    for i, entry in enumerate(history):
+        try:
+            print(f"Procesando entrada {i}: {entry}")
+            fecha = entry['Fecha']
+            if isinstance(fecha, str):
+                date_obj = datetime.datetime.strptime(fecha, "%Y-%m-%d").date()
+                print(f"  Fecha como string: {fecha} -> {date_obj}")
+            else:
+                date_obj = fecha
+                print(f"  Fecha como objeto: {fecha} -> {date_obj}")
+            hour = int(entry.get('Hora Inicio', '00:00:00').split(':')[0])
+            if 'Tiempo Activo (min)' in entry:
+                duration = float(entry['Tiempo Activo (min)']) / 60
+                print(f"  Duración en minutos: {entry['Tiempo Activo (min)']} -> {duration} horas")
+            else:
+                duration = float(entry.get('Tiempo Activo (horas)', 0))
+                print(f"  Duración en horas: {duration}")
+            activity = entry.get('Actividad', '').strip()
+            project = entry.get('Proyecto', '').strip()
+            task = entry.get('Tarea', '').strip()
+            print(f"  Actividad: {activity}, Proyecto: {project}, Tarea: {task}")
+            data['activities'][activity] += duration
+            if project:
+                data['projects'][project] += duration
+            if task:
+                data['tasks'][task] += duration
+            data['daily_total'][entry['Fecha']] += duration
+            data['raw_data'].append({'date': date_obj, 'hour': hour, 'duration': duration,
+                                     'activity': activity, 'project': project, 'task': task})
+            print(f"  Entrada {i} procesada correctamente")
+        except Exception as e:
+            data['errors'].append(f"Error procesando entrada {i}: {e}")
+    return data
+
+def legacy_pipeline(history):
+    """Análisis original más los DataFrames que cada pestaña reconstruía desde raw_data"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        data = legacy_analyze(history)
+    raw = data['raw_data']
+    pd.DataFrame([{'date': r['date'], 'hours': r['duration']} for r in raw]).groupby('date').sum()
+    activities = sorted({r['activity'] for r in raw if r['activity']})
+    projects = sorted({r['project'] for r in raw if r['project']})
+    heatmap = np.zeros((len(activities), len(projects)))
+    for r in raw:
+        if r['project'] and r['activity']:
+            heatmap[activities.index(r['activity']), projects.index(r['project'])] += r['duration']
+    pd.DataFrame([{'Fecha': r['date'].strftime("%Y-%m-%d"), 'Hora': f"{r['hour']:02d}:00",
+                   'Duración (horas)': round(r['duration'], 2), 'Actividad': r['activity'],
+                   'Proyecto': r['project'], 'Tarea': r['task']} for r in raw])
+    return data, heatmap.sum()
+
+def current_pipeline(app, sessions):
+    """DataFrame tipado y entradas de los gráficos tal como las construye stats_tab()"""
+    data = app.analyze_data.__wrapped__('bench', 1, sessions)
+    frame = data['frame']
+    data['daily_total'].rename('hours').reset_index()
+    labelled = frame[(frame['activity'] != '') & (frame['project'] != '')]
+    heatmap = labelled.pivot_table(index='activity', columns='project', values='duration',
+                                   aggfunc='sum', fill_value=0)
+    pd.DataFrame({'Fecha': frame['date'].dt.strftime("%Y-%m-%d"),
+                  'Hora': frame['hour'].astype(str).str.zfill(2) + ":00",
+                  'Duración (horas)': frame['duration'].round(2),
+                  'Actividad': frame['activity'], 'Proyecto': frame['project'], 'Tarea': frame['task']})
+    return data, float(heatmap.to_numpy().sum())
+
+def main():
+    app = load_app()
+    history = legacy_sessions(SESSIONS)
+
+    old_time, (old_data, old_heat) = timed(lambda: legacy_pipeline(history), repeat=1)
+    decode_time, sessions = timed(lambda: app.decode_sessions(history))
+    new_time, (new_data, new_heat) = timed(lambda: current_pipeline(app, sessions))
+
+    print(f"{SESSIONS} sesiones")
+    print(f"  antes (bucle + print + DataFrames por gráfico): {old_time:.2f} s")
+    print(f"  ahora (DataFrame tipado + groupbys):            {new_time:.2f} s")
+    print(f"  decode_sessions (una vez al cargar):            {decode_time:.2f} s")
+    same = abs(sum(old_data['activities'].values()) - sum(new_data['activities'].values())) < 1e-6 \
+        and abs(old_heat - new_heat) < 1e-6
+    print(f"  totales y heatmap idénticos: {same}")
+
+if __name__ == "__main__":
+    main()
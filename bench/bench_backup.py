@@ -0,0 +1,58 @@
+"""Benchmark de la exportación de backups con 100.000 sesiones (user-021).
+
+Antes, cada visita a Configuración serializaba todo el estado con indent=2,
+lo comprimía, lo pasaba a base64 y lo incrustaba en un enlace markdown
+(reproducido abajo). Ahora cada render sólo toma una instantánea por
+referencias y el gzip NDJSON se genera al pulsar descargar. El script mide
+los dos renders, la generación del archivo y la lectura de vuelta, y
+comprueba que el viaje de ida y vuelta no pierde datos.
+
+    python bench/bench_backup.py
+"""
+import base64
+import gzip
+import io
+import json
+
+from common import legacy_sessions, load_app, timed
+
+SESSIONS = 100_000
+TASKS = 500
+
+def legacy_export(app, state):
+    """export_data() original: JSON indentado + gzip + base64 en cada render"""
+    export_dict = app.convert_dates_to_iso({
+        'activities': state['activities'],
+        'tasks': state['tasks'],
+        'projects': state['projects'],
+        'achievements': state['achievements'],
+        'session_history': state['session_history']
+    })
+    json_str = json.dumps(export_dict, indent=2, ensure_ascii=False, default=app.json_serial)
+    b64 = base64.b64encode(gzip.compress(json_str.encode('utf-8'))).decode()
+    return f'<a href="data:application/gzip;base64,{b64}" download="pomodoro_backup.json.gz">Descargar backup</a>'
+
+def main():
+    app = load_app()
+    state = app.get_default_state()
+    state['activities'] = ['Estudio', 'Trabajo', 'Lectura']
+    state['tasks'] = app.TaskStore(app.Task(f'Tarea {i}', project=f'P{i % 15}', activity='Estudio')
+                                   for i in range(TASKS))
+    state['session_history'] = app.decode_sessions(legacy_sessions(SESSIONS))
+
+    old_time, link = timed(lambda: legacy_export(app, state), repeat=1)
+    render_time, snapshot = timed(lambda: app.backup_snapshot(state))
+    build_time, (data, _) = timed(lambda: app.build_backup(snapshot), repeat=1)
+    read_time, restored = timed(lambda: app.decode_state(app.read_backup(io.BytesIO(data))[0]), repeat=1)
+
+    print(f"{SESSIONS} sesiones, {TASKS} tareas")
+    print(f"  render antes (JSON + gzip + base64 en la página): {old_time:.2f} s, {len(link) / 1e6:.2f} MB de enlace")
+    print(f"  render ahora (instantánea por referencias):       {render_time * 1000:.1f} ms")
+    print(f"  generar al pulsar (gzip NDJSON):                  {build_time:.2f} s, {len(data) / 1e6:.2f} MB")
+    print(f"  leer y decodificar el backup:                     {read_time:.2f} s")
+    lossless = list(restored['session_history']) == list(state['session_history']) \
+        and [t.to_dict() for t in restored['tasks']] == [t.to_dict() for t in state['tasks']]
+    print(f"  ida y vuelta sin pérdidas: {lossless}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Benchmark de las acciones en bloque sobre tareas (user-017).
+
+Con 1.000 tareas (200 en el proyecto filtrado) compara completar una tarea
+con su botón, que cuesta una ejecución completa del script por tarea, con
+completar las demás desde el panel "Acciones en bloque": una ejecución y un
+único guardado. Los guardados se cuentan en la cola de guardado (SaveQueue)
+sin enviarlos, así que no hace falta Supabase.
+
+    python bench/bench_bulk_tasks.py
+"""
+import datetime
+import os
+import tempfile
+import time
+
+from common import ROOT, load_app
+
+from streamlit.testing.v1 import AppTest
+
+TASKS = 1000
+SELECTED = 200
+
+def main():
+    os.environ.setdefault("POMODORO_SESSIONS_DB", os.path.join(tempfile.mkdtemp(), "sessions.db"))
+    app = load_app()
+
+    at = AppTest.from_file(os.path.join(ROOT, "FINAL_APP.py"), default_timeout=120)
+    at.session_state['authenticated'] = True
+    at.session_state['username'] = 'bench'
+    at.session_state['data_loaded'] = True  # Sin carga desde Supabase
+    queue = app.SaveQueue('bench', delay=3600)  # Cuenta los guardados sin llegar a escribirlos
+    at.session_state['save_queue'] = queue
+    state = app.get_default_state()
+    state['activities'] = ['Estudio']
+    state['current_activity'] = 'Estudio'
+    state['projects'] = [app.Project('P', 'Estudio'), app.Project('Q', 'Estudio')]
+    state['tasks'] = app.TaskStore(
+        app.Task(f'T{i}', project='P' if i < SELECTED else 'Q', activity='Estudio',
+                 deadline=datetime.date.today()) for i in range(TASKS))
+    at.session_state['pomodoro_state'] = state
+    at.session_state['sidebar_nav'] = "📋 Tareas"
+    at.run()
+    at.selectbox(key='filter_project_selector').set_value('P').run()
+    if at.exception:
+        raise SystemExit(f"La app falló: {at.exception}")
+
+    # Una tarea con su botón
+    task_id = next(iter(state['tasks'].filter(project='P'))).id
+    start = time.perf_counter()
+    at.button(key=f'complete_{task_id}').click().run()
+    single = time.perf_counter() - start
+
+    # El resto con una sola acción en bloque
+    bulk_round = at.session_state['bulk_round'] if 'bulk_round' in at.session_state else 0
+    at.checkbox(key=f'bulk_all_{bulk_round}').check().run()
+    saves = queue.requested
+    start = time.perf_counter()
+    at.button(key='bulk_apply').click().run()
+    bulk = time.perf_counter() - start
+    bulk_saves = queue.requested - saves
+    completed = len(state['tasks'].filter(project='P', completed=True))
+    if queue.timer is not None:
+        queue.timer.cancel()
+
+    print(f"{TASKS} tareas, {SELECTED} en el proyecto filtrado")
+    print(f"  una a una: 1 ejecución por tarea ({single:.2f} s)"
+          f" -> {SELECTED} ejecuciones, {single * SELECTED / 60:.1f} min para {SELECTED} tareas")
+    print(f"  en bloque: 1 ejecución ({bulk:.2f} s) y {bulk_saves} guardado para {SELECTED - 1} tareas")
+    print(f"  completadas: {completed}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Benchmark de la decodificación del estado guardado (user-011).
+
+Compara el recorrido original convert_iso_to_dates(), reproducido abajo, que
+aplicaba dos expresiones regulares a cada texto del estado, con
+decode_state(), que sólo convierte los campos de fecha del esquema. El blob
+tiene 100.000 sesiones y 6.000 tareas en el formato antiguo (schema_version 2,
+con completed_tasks). Ambos tiempos incluyen json.loads, que se mide aparte.
+
+    python bench/bench_decode.py
+"""
+import datetime
+import json
+import re
+
+from common import legacy_sessions, legacy_tasks, load_app, timed
+
+SESSIONS = 100_000
+TASKS = 3000  # Pendientes; otras tantas completadas
+
+def convert_iso_to_dates(obj):
+    """Recorrido original: prueba dos regex en cada texto para adivinar si es una fecha"""
+    if isinstance(obj, str):
+        try:
+            if re.match(r'^\d{4}-\d{2}-\d{2}$', obj):
+                return datetime.datetime.strptime(obj, '%Y-%m-%d').date()
+            elif re.match(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}', obj):
+                return datetime.datetime.fromisoformat(obj.replace('Z', '+00:00'))
+        except (ValueError, AttributeError):
+            pass
+        return obj
+    elif isinstance(obj, dict):
+        return {k: convert_iso_to_dates(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [convert_iso_to_dates(element) for element in obj]
+    return obj
+
+def main():
+    app = load_app()
+    tasks = legacy_tasks(TASKS)
+    blob = {
+        'schema_version': 2,
+        'tasks': tasks,
+        'completed_tasks': [dict(task, completed=True, completed_date='2024-04-10') for task in tasks],
+        'session_history': [app.convert_dates_to_iso(entry) for entry in legacy_sessions(SESSIONS)],
+        'last_session_date': '2024-05-01',
+        'start_time': '2024-05-01T10:00:00.123456',
+        'activities': ['Estudio']
+    }
+    text = json.dumps(blob)
+
+    parse_time, _ = timed(lambda: json.loads(text))
+    old_time, old = timed(lambda: convert_iso_to_dates(json.loads(text)))
+    new_time, new = timed(lambda: app.decode_state(json.loads(text)))
+
+    print(f"Blob de {len(text) / 1e6:.1f} MB ({SESSIONS} sesiones, {2 * TASKS} tareas)")
+    print(f"  json.loads:                         {parse_time:.2f} s")
+    print(f"  antes (regex en cada texto + parse): {old_time:.2f} s")
+    print(f"  ahora (decode_state + parse):        {new_time:.2f} s")
+    same = [entry['Fecha'] for entry in old['session_history']] == [s.date for s in new['session_history']] \
+        and [t['deadline'] for t in old['tasks'] + old['completed_tasks']] == [t.deadline for t in new['tasks']] \
+        and old['start_time'] == new['start_time']
+    print(f"  fechas decodificadas idénticas: {same}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Benchmark del coste por tick del temporizador (user-002).
+
+Mide, con 300 tareas, 5.000 sesiones y el temporizador en marcha:
+
+* antes: la versión original de FINAL_APP.py (commit BASELINE_REV, leída con
+  `git show`), que en cada tick de un segundo relanzaba el script completo
+  para mover el indicador. Se le quita la pausa de 0,1 s y el st.rerun() del
+  final de timer_tab() para medir una sola ejecución, y se fuerza la rama del
+  tick (last_update de hace un segundo).
+* ahora: la versión actual. La cuenta atrás la anima el navegador
+  (timer_component/, user-003, que sustituyó al fragmento con run_every de
+  esta petición), así que un tick no ejecuta nada en el servidor; se mide
+  también una ejecución completa, que sólo ocurre al pulsar un control o al
+  terminar la fase.
+
+    python bench/bench_timer_tick.py [revisión_original]
+"""
+import datetime
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import ROOT, load_app, legacy_sessions
+
+from streamlit.testing.v1 import AppTest
+
+BASELINE_REV = "9ab37ee"  # Commit original del repositorio
+RUNS = 10
+TICK_LOOP = "    time.sleep(0.1)\n    st.rerun()"
+
+def baseline_script(rev):
+    """Escribe en un archivo temporal la versión original, sin el bucle de reruns"""
+    source = subprocess.check_output(['git', '-C', ROOT, 'show', f'{rev}:FINAL_APP.py'], text=True)
+    if source.count(TICK_LOOP) != 1:
+        raise SystemExit(f"{rev}:FINAL_APP.py no tiene el bucle de ticks esperado")
+    path = os.path.join(tempfile.mkdtemp(), "FINAL_APP_original.py")
+    with open(path, "w", encoding="utf-8") as script:
+        script.write(source.replace(TICK_LOOP, "    pass"))
+    return path
+
+def time_runs(at, before_run=None):
+    """Tiempo medio de RUNS ejecuciones completas del script"""
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        if before_run:
+            before_run()
+        at.run()
+    if at.exception:
+        raise SystemExit(f"La app falló: {at.exception}")
+    return (time.perf_counter() - start) / RUNS
+
+def bench_baseline(rev):
+    """Coste de un tick en la versión original (estado en diccionarios)"""
+    at = AppTest.from_file(baseline_script(rev), default_timeout=120)
+    at.session_state['authenticated'] = True
+    at.session_state['username'] = 'bench'
+    at.run()
+    today = datetime.date.today()
+    state = at.session_state['pomodoro_state']
+    state['activities'] = ['Estudio', 'Trabajo']
+    state['current_activity'] = 'Estudio'
+    state['projects'] = [{'name': f'P{i}', 'activity': 'Estudio'} for i in range(20)]
+    state['tasks'] = [{'name': f'T{i}', 'project': f'P{i % 20}', 'activity': 'Estudio', 'priority': 'Media',
+                       'deadline': today + datetime.timedelta(days=i % 30), 'completed': False,
+                       'created': today} for i in range(300)]
+    state['session_history'] = legacy_sessions(5000)
+    state['timer_running'] = True
+
+    def tick():
+        at.session_state['last_update'] = time.time() - 1.0
+    tick()
+    at.run()
+    return time_runs(at, tick)
+
+def bench_current():
+    """Coste de una ejecución completa de la versión actual"""
+    os.environ.setdefault("POMODORO_SESSIONS_DB", os.path.join(tempfile.mkdtemp(), "sessions.db"))
+    app = load_app()
+    at = AppTest.from_file(os.path.join(ROOT, "FINAL_APP.py"), default_timeout=120)
+    at.session_state['authenticated'] = True
+    at.session_state['username'] = 'bench'
+    at.session_state['data_loaded'] = True  # Sin carga desde Supabase
+    state = app.get_default_state()
+    state['activities'] = ['Estudio', 'Trabajo']
+    state['current_activity'] = 'Estudio'
+    state['projects'] = [app.Project(f'P{i}', 'Estudio') for i in range(20)]
+    state['tasks'] = app.TaskStore(app.Task(f'T{i}', project=f'P{i % 20}', activity='Estudio')
+                                   for i in range(300))
+    state['session_history'] = app.decode_sessions(legacy_sessions(5000))
+    state['rollups'] = app.rebuild_rollups(state['session_history'])
+    app.start_timer(state)
+    at.session_state['pomodoro_state'] = state
+    at.run()
+    return time_runs(at)
+
+def main():
+    rev = sys.argv[1] if len(sys.argv) > 1 else BASELINE_REV
+    before = bench_baseline(rev)
+    current_run = bench_current()
+
+    print("Temporizador en marcha, 300 tareas, 5.000 sesiones")
+    print(f"  antes ({rev}): un tick = ejecución completa del script: {before * 1000:.1f} ms"
+          f" ({before * 60:.1f} s de servidor por minuto)")
+    print("  ahora: un tick = 0 ejecuciones (la cuenta atrás corre en el navegador)")
+    print(f"  ahora: ejecución completa (sólo al pulsar un control o al terminar la fase): "
+          f"{current_run * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
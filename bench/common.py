@@ -0,0 +1,63 @@
+"""Utilidades compartidas por los benchmarks de Pomodoro Pro.
+
+Los scripts se ejecutan desde la raíz del repositorio, por ejemplo:
+
+    python bench/bench_analytics.py
+
+Importan FINAL_APP en modo "bare" de Streamlit (sin servidor) y generan datos
+sintéticos reproducibles (semilla fija), así que no necesitan Supabase.
+"""
+import datetime
+import logging
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def load_app():
+    """Importa FINAL_APP silenciando los avisos del modo bare de Streamlit"""
+    logging.disable(logging.WARNING)
+    import FINAL_APP
+    return FINAL_APP
+
+def legacy_sessions(n, seed=1):
+    """Historial en el formato antiguo (claves en español, fechas str/date, 10% en minutos)"""
+    rng = random.Random(seed)
+    activities = ['Estudio', 'Trabajo', 'Lectura']
+    projects = ['P%d' % i for i in range(15)] + ['']
+    base = datetime.date(2020, 1, 1)
+    history = []
+    for i in range(n):
+        day = base + datetime.timedelta(days=rng.randrange(1500))
+        entry = {
+            'Fecha': day if i % 2 else day.isoformat(),
+            'Hora Inicio': f"{rng.randrange(24):02d}:15:00",
+            'Actividad': rng.choice(activities),
+            'Proyecto': rng.choice(projects),
+            'Tarea': f"T{rng.randrange(200)}"
+        }
+        if i % 10 == 0:
+            entry['Tiempo Activo (min)'] = rng.randrange(5, 60)
+        else:
+            entry['Tiempo Activo (horas)'] = round(rng.random(), 2)
+        history.append(entry)
+    return history
+
+def legacy_tasks(n):
+    """Tareas en el formato de diccionario antiguo"""
+    return [{
+        'name': f'Tarea {i}', 'project': f'P{i % 15}', 'activity': 'Estudio', 'priority': 'Media',
+        'deadline': '2024-05-01', 'completed': False, 'created': '2024-04-01'
+    } for i in range(n)]
+
+def timed(fn, repeat=3):
+    """Ejecuta fn varias veces y devuelve (mejor tiempo en segundos, último resultado)"""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
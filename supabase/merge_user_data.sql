@@ -0,0 +1,19 @@
+-- Guardado incremental del estado de Pomodoro Pro.
+-- Fusiona sólo las claves de primer nivel modificadas en la columna JSON
+-- `data` de la tabla `users`, en lugar de reescribir el estado completo.
+
+create or replace function merge_user_data(p_username text, p_patch jsonb)
+returns void
+language sql
+security definer
+set search_path = public
+as $$
+    update users
+       set data = coalesce(data, '{}'::jsonb) || p_patch,
+           last_updated = now()
+     where username = p_username;
+$$;
+
+-- La función se salta RLS: sólo la puede llamar el cliente de servicio
+revoke execute on function merge_user_data(text, jsonb) from public, anon, authenticated;
+grant execute on function merge_user_data(text, jsonb) to service_role;
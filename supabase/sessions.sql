@@ -0,0 +1,40 @@
+-- Historial de sesiones de Pomodoro Pro: una fila por sesión registrada.
+-- log_session() sólo hace un INSERT y el historial puede consultarse por
+-- rango de fechas sin cargar la columna JSON `data` de `users`.
+
+create table if not exists sessions (
+    id bigint generated always as identity primary key,
+    username text not null references users (username) on delete cascade,
+    fecha date not null,
+    hora_inicio text,
+    horas double precision not null,
+    actividad text,
+    proyecto text,
+    tarea text
+);
+
+create index if not exists sessions_username_fecha on sessions (username, fecha);
+
+-- La app sólo accede con el cliente de servicio: RLS activado y ninguna
+-- política para anon/authenticated, así PostgREST no expone el historial.
+alter table sessions enable row level security;
+
+-- Sustituye todo el historial de un usuario en una sola transacción
+-- (importaciones y migración del historial incrustado en `users.data`).
+create or replace function replace_user_sessions(p_username text, p_rows jsonb)
+returns void
+language sql
+security definer
+set search_path = public
+as $$
+    delete from sessions where username = p_username;
+    insert into sessions (username, fecha, hora_inicio, horas, actividad, proyecto, tarea)
+    select p_username, r.fecha, r.hora_inicio, r.horas, r.actividad, r.proyecto, r.tarea
+      from rows from (jsonb_to_recordset(p_rows) as (fecha date, hora_inicio text, horas double precision,
+                                                     actividad text, proyecto text, tarea text))
+           with ordinality as r(fecha, hora_inicio, horas, actividad, proyecto, tarea, position)
+     order by r.position;
+$$;
+
+revoke execute on function replace_user_sessions(text, jsonb) from public, anon, authenticated;
+grant execute on function replace_user_sessions(text, jsonb) to service_role;